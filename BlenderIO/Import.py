@@ -1,16 +1,18 @@
-import array
+import multiprocessing
 import os
-import math
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import bpy
-from bpy.props import CollectionProperty
+from bpy.props import BoolProperty, CollectionProperty, EnumProperty
 from bpy_extras.io_utils import ImportHelper
 from mathutils import Matrix, Vector
 import numpy as np
 
-from ..DarkCloudModelTools.filetypes.CHR.CHRInterface import CHRInterface
 from ..DarkCloudModelTools.filetypes.CHR.Model import Model
-from ..DarkCloudModelTools.filetypes.IMG.ImageInterface import ImageInterface
+from ..DarkCloudModelTools.filetypes.IMG.TextureCache import TextureCache
+from .TextureRegistry import TextureRegistry
 
 UNIT_MATRIX =  Matrix([
     [1, 0, 0, 0],
@@ -19,37 +21,20 @@ UNIT_MATRIX =  Matrix([
     [0, 0, 0, 1]
 ])
 
-def vec_roll_to_mat3(vec, roll):
-    """
-    https://blender.stackexchange.com/a/38337
-    """
-    target = Vector((0, 0.1, 0))
-    nor = vec.normalized()
-    axis = target.cross(nor)
-    if axis.dot(axis) > 10**-10:
-        axis.normalize()
-        theta = target.angle(nor)
-        bMatrix = Matrix.Rotation(theta, 3, axis)
-    else:
-        updown = 1 if target.dot(nor) > 0 else -1
-        bMatrix = Matrix.Scale(updown, 3)
-        bMatrix[2][2] = 1.0
+PACK_PENDING_PROPERTY = "dc_pack_pending"
 
-    rMatrix = Matrix.Rotation(roll, 3, nor)
-    mat = rMatrix @ bMatrix
-    return mat
 
-
-def mat3_to_vec_roll(mat):
+@bpy.app.handlers.persistent
+def pack_pending_images(*args):
     """
-    https://blender.stackexchange.com/a/38337
+    save_pre handler that packs the textures whose packing was deferred at
+    import time.
     """
-    vec = mat.col[1]
-    vecmat = vec_roll_to_mat3(mat.col[1], 0)
-    vecmatinv = vecmat.inverted()
-    rollmat = vecmatinv @ mat
-    roll = math.atan2(rollmat[0][2], rollmat[2][2])
-    return vec, roll
+    for bpy_img in bpy.data.images:
+        if bpy_img.get(PACK_PENDING_PROPERTY):
+            bpy_img.pack()
+            del bpy_img[PACK_PENDING_PROPERTY]
+
 
 class ImportDC(bpy.types.Operator, ImportHelper):
     bl_idname = 'import_file.import_dark_cloud'
@@ -66,20 +51,75 @@ class ImportDC(bpy.types.Operator, ImportHelper):
 
     files: CollectionProperty(type=bpy.types.PropertyGroup)
     
+    use_texture_cache: BoolProperty(
+        name="Cache Decoded Textures",
+        description="Keep decoded textures on disk so that re-imports can skip decoding them",
+        default=True
+    )
+    
+    pack_textures: EnumProperty(
+        name="Pack Textures",
+        description="When to pack imported textures into the .blend file",
+        items=[("NOW",   "On Import", "Pack each texture as it is imported"),
+               ("DEFER", "On Save",   "Pack textures just before the .blend file is next saved"),
+               ("NONE",  "Never",     "Leave textures unpacked. Generated images are lost when the file is reloaded unless packed or saved")],
+        default="DEFER"
+    )
+    
+    use_worker_processes: BoolProperty(
+        name="Parse in Background",
+        description="When importing several files, parse them in worker processes while earlier ones are built",
+        default=True
+    )
+    
     def execute(self, context):
         folder = (os.path.dirname(self.filepath))
+        filepaths = [os.path.join(folder, file.name) for file in self.files if file.name]
+        if not filepaths:
+            filepaths = [self.filepath]
         
-        # add iteration through the selected files later
-        self.import_file(context, self.filepath)
+        bpy.ops.object.select_all(action='DESELECT')
+        self.texture_registry = TextureRegistry()
+        cache = TextureCache.default() if self.use_texture_cache else None
+        
+        if len(filepaths) > 1 and self.use_worker_processes:
+            self.import_files_in_background(context, filepaths, cache)
+        else:
+            for filepath in filepaths:
+                self.import_file(context, filepath, Model.from_file(filepath, decode_textures=True, texture_cache=cache))
 
         return {'FINISHED'}
     
-    def import_file(self, context, filepath):
-        bpy.ops.object.select_all(action='DESELECT')
-        
-        ci = CHRInterface.from_file(filepath)
-        model = Model.from_chr(ci)
-        
+    def import_files_in_background(self, context, filepaths, cache):
+        """
+        Parses the files in a pool of worker processes, and builds each
+        model on this thread as soon as its worker has finished. Files that
+        fail to import are skipped and reported together at the end.
+        """
+        # Blender's own binary cannot act as a worker, so point the pool
+        # at its bundled Python (binary_path_python was removed in 2.92)
+        mp_context = multiprocessing.get_context("spawn")
+        mp_context.set_executable(getattr(bpy.app, "binary_path_python", sys.executable))
+        workers = min(len(filepaths), os.cpu_count() or 1)
+        with ProcessPoolExecutor(workers, mp_context=mp_context) as pool:
+            futures = {pool.submit(Model.from_file, filepath, decode_textures=True, texture_cache=cache): filepath
+                       for filepath in filepaths}
+            failed = []
+            for future in as_completed(futures):
+                filepath = futures[future]
+                try:
+                    self.import_file(context, filepath, future.result())
+                except Exception:
+                    # Keep the details in the system console
+                    traceback.print_exc()
+                    # A failure while building the armature leaves edit mode on
+                    if context.mode != 'OBJECT':
+                        bpy.ops.object.mode_set(mode='OBJECT')
+                    failed.append(os.path.split(filepath)[-1])
+        if failed:
+            self.report({'WARNING'}, f"Failed to import {len(failed)} file(s): {', '.join(sorted(failed))}")
+    
+    def import_file(self, context, filepath, model):
         # Create Empty Axis
         filename = os.path.split(filepath)[-1]
         parent_obj = bpy.data.objects.new(filename, None)
@@ -88,11 +128,11 @@ class ImportDC(bpy.types.Operator, ImportHelper):
         for submodel in model.submodels:
             # Create Armature
             armature_name = filename + "_armature"
-            self.import_armature(parent_obj, armature_name, submodel)
+            armature = self.import_armature(parent_obj, armature_name, submodel)
             
             # Create Model
             textures = self.import_textures(submodel)
-            self.import_meshes(bpy.data.objects[armature_name], submodel)
+            self.import_meshes(armature, submodel, textures)
         
     def import_armature(self, parent_obj, armature_name, model):
         # DEFINITELY INCORRECT SOMEWHERE
@@ -107,185 +147,167 @@ class ImportDC(bpy.types.Operator, ImportHelper):
         bpy.context.view_layer.objects.active = model_armature
         bpy.ops.object.mode_set(mode='EDIT')
         
-        parents = {i : b.parent for i, b in enumerate(model.mds.bones)}
-        matrices = [np.reshape(b.matrix, (4, 4)) for b in model.mds.bones]
-        
-        def combine_matrices(idx):
-            if idx == -1:
-                return np.eye(4)
-            else:
-                parent_idx = parents[idx]
-                return matrices[idx] @ combine_matrices(parent_idx)
-                
+        skeleton = model.mds.skeleton
+        heads, tails, rolls = skeleton.head_tail_roll()
         
+        # Create parents before their children
         list_of_bones = {}
-        names = [b.name for b in model.mds.bones]
-        total_matrices = [combine_matrices(i) for i in range(len(matrices))]
-        for i, (bone_name, matrix) in enumerate(zip(names, total_matrices)):           
-            bone = model_armature.data.edit_bones.new(bone_name)
-
-            tail, roll = mat3_to_vec_roll(Matrix(matrix[:3, :3].tolist()))
-
+        for i in skeleton.order.tolist():
+            bone = model_armature.data.edit_bones.new(model.mds.bones[i].name)
             list_of_bones[i] = bone
-            bone.head = Vector([0., 0., 0.])
-            bone.tail = Vector([0., 1, 0.])  # Make this scale with the model size in the future, for convenience
             
-            bone.head = Vector([*matrix[3, :3]])
-            bone.tail = Vector([*matrix[3, :3]]) + tail
-            bone.roll = roll
+            bone.head = Vector(heads[i].tolist())
+            bone.tail = Vector(tails[i].tolist())
+            bone.roll = rolls[i]
 
-            parent = parents[i]
+            parent = model.mds.bones[i].parent
             if parent != -1:
                 bone.parent = list_of_bones[parent]
 
                 
         bpy.ops.object.mode_set(mode='OBJECT')
         bpy.context.view_layer.objects.active = parent_obj
+        return model_armature
         
     def generate_bone_idx_to_mesh_idx(self, model):
-        bone_idx_to_mdt_idx = {i: b.mdt_idx for i, b in enumerate(model.mds.bones)}
-        return bone_idx_to_mdt_idx
+        return model.bone_idx_to_mesh_idx()
         
     def generate_mesh_idx_to_bone_idx(self, model):
-        return {m_idx : b_idx for b_idx, m_idx in self.generate_bone_idx_to_mesh_idx(model).items()}
+        return model.mesh_idx_to_bone_idx()
     
     def generate_weights(self, model):
-        bone_idx_to_mdt_idx = self.generate_bone_idx_to_mesh_idx(model)
-        weights = {}
-        for vertex_group in model.wgt.groups:
-            mesh_idx = bone_idx_to_mdt_idx[vertex_group.meshbone_idx]
-            if mesh_idx not in weights:
-                weights[mesh_idx] = {}
-            
-            bone_idx = vertex_group.bone_idx
-            if bone_idx not in weights[mesh_idx]:
-                weights[mesh_idx][bone_idx] = []
-            for e in vertex_group.elements:
-                if e.weight > 0:
-                    weights[mesh_idx][bone_idx].append((e.index, e.weight/100))
-                
-        return weights
+        return model.generate_weights()
+    
+    @staticmethod
+    def add_weights(vertex_group, indices, weights):
+        """
+        Adds weights to a vertex group with one call per distinct weight,
+        rather than one call per vertex.
+        """
+        distinct, inverse = np.unique(weights, return_inverse=True)
+        order = np.argsort(inverse, kind="stable")
+        bounds = np.cumsum(np.bincount(inverse, minlength=len(distinct)))
+        for weight, bucket in zip(distinct.tolist(), np.split(indices[order], bounds[:-1])):
+            vertex_group.add(bucket.tolist(), weight, "REPLACE")
         
     def import_textures(self, model):
-        textures = []
-        for img in model.imgs:
-            for tm2_record, tm2 in zip(img.image_records, img.image_data):
-                tm2_name = tm2_record.filename.partition(b'\x00')[0].decode('ascii')
-                assert len(tm2.images) == 1
-                tm2i = tm2.images[0]
-                ii = ImageInterface.from_TM2(tm2i)
+        """
+        Returns a dict mapping each texture name to its Blender image.
+        Textures whose pixels match an image that was already imported
+        reuse that image.
+        """
+        if model.textures is None:
+            model.decode_textures(TextureCache.default() if self.use_texture_cache else None)
+        
+        textures = {}
+        for tm2_name, ii in model.textures.items():
+            content_hash = ii.content_hash()
+            bpy_img = self.texture_registry.get_image(content_hash)
+            if bpy_img is None:
                 bpy_img = bpy.data.images.new(f"{tm2_name}", 
-                                              tm2i.header.image_width, 
-                                              tm2i.header.image_width,
+                                              ii.width, 
+                                              ii.height,
                                               alpha=True)
-                bpy_img.pixels = [v for pixel in ii.pixels for v in pixel]
+                bpy_img.pixels.foreach_set(ii.pixels)
                 bpy_img.update()
-                bpy_img.filepath_raw = "{tm2_name}.png"
+                bpy_img.filepath_raw = f"{tm2_name}.png"
                 bpy_img.file_format = "PNG"
-                bpy_img.pack()
-                textures.append(bpy_img)
+                if self.pack_textures == "NOW":
+                    bpy_img.pack()
+                elif self.pack_textures == "DEFER":
+                    bpy_img[PACK_PENDING_PROPERTY] = True
+                self.texture_registry.add_image(content_hash, bpy_img)
+            textures[tm2_name] = bpy_img
         return textures
     
-    def import_meshes(self, armature, model):
+    def import_meshes(self, armature, model, textures):
         weights = self.generate_weights(model)
         mdt_idx_to_bone_idx = self.generate_mesh_idx_to_bone_idx(model)
         for mesh_idx, mesh in enumerate(model.mds.meshes):
-            verts = mesh.vertices
-            tris = [[t.loop_1.vertex_idx, t.loop_2.vertex_idx, t.loop_3.vertex_idx] for t in mesh.faces]
+            n_loops = mesh.loop_count
+            n_faces = mesh.face_count
             
             # Init mesh
             meshobj_name = f"mesh_{mesh_idx}"
             bpy_mesh = bpy.data.meshes.new(name=meshobj_name)
             mesh_object = bpy.data.objects.new(meshobj_name, bpy_mesh)
-            mesh_object.data.from_pydata(verts, [], tris)
             
-            # Generate loop data
-            loop_data_map = {}
-            for face_idx, face in enumerate(mesh.faces):
-                loop_data_map[(face_idx, face.loop_1.vertex_idx)] = face.loop_1
-                loop_data_map[(face_idx, face.loop_2.vertex_idx)] = face.loop_2
-                loop_data_map[(face_idx, face.loop_3.vertex_idx)] = face.loop_3
-                
-            loop_data = [None]*len(bpy_mesh.loops)
-            for poly_idx, poly in enumerate(bpy_mesh.polygons):
-                for loop_idx in poly.loop_indices:
-                    assert loop_data[loop_idx] is None, "CRITICAL ERROR: Loop data already enumerated"
-                    facevert_key = (poly_idx, bpy_mesh.loops[loop_idx].vertex_index)
-                    loop_data[loop_idx] = loop_data_map[facevert_key]
-            del loop_data_map
+            # Every face is a triangle, so the loops are already in face order
+            bpy_mesh.vertices.add(len(mesh.positions))
+            bpy_mesh.vertices.foreach_set("co", mesh.positions.reshape(-1))
+            bpy_mesh.loops.add(n_loops)
+            bpy_mesh.loops.foreach_set("vertex_index", mesh.loop_vertex)
+            bpy_mesh.polygons.add(n_faces)
+            bpy_mesh.polygons.foreach_set("loop_start", np.arange(0, n_loops, 3, dtype=np.int32))
+            if bpy.app.version < (4, 0, 0):
+                bpy_mesh.polygons.foreach_set("loop_total", np.full(n_faces, 3, dtype=np.int32))
+            bpy_mesh.update()
             
             # Create UVs
             uv_layer = bpy_mesh.uv_layers.new(name="UVMap", do_init=True)
-            for loop_idx, loop in enumerate(bpy_mesh.loops):
-                uv_layer.data[loop_idx].uv = loop_data[loop_idx].uv
+            uv_layer.data.foreach_set("uv", mesh.loop_uv.reshape(-1))
 
             # Rig
             if mesh_idx in weights:
                 mesh_weights = weights[mesh_idx]
-                for bone_idx, mesh_bone_weights in mesh_weights.items():
+                for bone_idx, (v_indices, v_weights) in mesh_weights.items():
                     vg_name = model.mds.bones[bone_idx].name
                     vg = mesh_object.vertex_groups.new(name=vg_name)
-                    for v_idx, v_weight in mesh_bone_weights:
-                        vg.add([v_idx], v_weight, "REPLACE")
+                    self.add_weights(vg, v_indices, v_weights)
             elif mesh_idx in mdt_idx_to_bone_idx:
                 bone_idx = mdt_idx_to_bone_idx[mesh_idx]
                 vg_name = model.mds.bones[bone_idx].name
                 vg = mesh_object.vertex_groups.new(name=vg_name)
-                for idx in range(len(verts)):
-                    vg.add([idx], 1., "REPLACE")
+                vg.add(list(range(len(mesh.positions))), 1., "REPLACE")
                 
 
             # Import materials
             for mat_idx, material in enumerate(mesh.materials):
-                bpy_mat = bpy.data.materials.new(name=f"{meshobj_name}_material_{mat_idx}")
                 tex_name = material.texture_name
-                
-                bpy_mat.use_nodes = True
-                nodes   = bpy_mat.node_tree.nodes
-                connect = bpy_mat.node_tree.links.new
-                
-                bsdf_node = nodes.get('Principled BSDF')
-                tex_img_node = nodes.new('ShaderNodeTexImage')
-                tex_img_node.name = tex_name
-                tex_img_node.label = tex_name
-                tex_img_node.image = bpy.data.images[tex_name]
-
-                connect(tex_img_node.outputs['Color'], bsdf_node.inputs['Base Color'])
-                connect(tex_img_node.outputs['Alpha'], bsdf_node.inputs['Alpha'])
+                bpy_img = textures.get(tex_name)
+                bpy_mat = self.texture_registry.get_material(bpy_img) if bpy_img is not None else None
+                if bpy_mat is None:
+                    bpy_mat = bpy.data.materials.new(name=f"{meshobj_name}_material_{mat_idx}")
+                    
+                    bpy_mat.use_nodes = True
+                    nodes   = bpy_mat.node_tree.nodes
+                    connect = bpy_mat.node_tree.links.new
+                    
+                    bsdf_node = nodes.get('Principled BSDF')
+                    tex_img_node = nodes.new('ShaderNodeTexImage')
+                    tex_img_node.name = tex_name
+                    tex_img_node.label = tex_name
+                    tex_img_node.image = bpy_img
+    
+                    connect(tex_img_node.outputs['Color'], bsdf_node.inputs['Base Color'])
+                    connect(tex_img_node.outputs['Alpha'], bsdf_node.inputs['Alpha'])
+                    if bpy_img is not None:
+                        self.texture_registry.add_material(bpy_img, bpy_mat)
                 
                 bpy_mesh.materials.append(bpy_mat)
                 
             # Assign face materials
-            for face, bpy_poly in zip(mesh.faces, bpy_mesh.polygons):
-                bpy_poly.material_index = face.material_idx
+            bpy_mesh.polygons.foreach_set("material_index", mesh.face_material)
             
             # Assign normals
             # Works thanks to this stackexchange answer https://blender.stackexchange.com/a/75957
             # which a few of these comments below are also taken from
             # Do this LAST because it can remove some loops
             bpy_mesh.create_normals_split()
-            for face in bpy_mesh.polygons:
-                face.use_smooth = True  # loop normals have effect only if smooth shading ?
+            bpy_mesh.polygons.foreach_set("use_smooth", np.ones(n_faces, dtype=bool))  # loop normals have effect only if smooth shading ?
 
             # Set loop normals
-            loop_normals = [Vector(l.normal) for l in loop_data]
-            bpy_mesh.loops.foreach_set("normal", [subitem for item in loop_normals for subitem in item])
+            bpy_mesh.loops.foreach_set("normal", mesh.loop_normal.reshape(-1))
 
             bpy_mesh.validate(clean_customdata=False)  # important to not remove loop normals here!
             bpy_mesh.update()
 
-            clnors = array.array('f', [0.0] * (len(bpy_mesh.loops) * 3))
+            # Read the normals back, since validation may have removed loops
+            clnors = np.empty(len(bpy_mesh.loops) * 3, dtype=np.float32)
             bpy_mesh.loops.foreach_get("normal", clnors)
 
-            bpy_mesh.polygons.foreach_set("use_smooth", [True] * len(bpy_mesh.polygons))
-            # This line is pretty smart (came from the stackoverflow answer)
-            # 1. Creates three copies of the same iterator over clnors
-            # 2. Splats those three copies into a zip
-            # 3. Each iteration of the zip now calls the iterator three times, meaning that three consecutive elements
-            #    are popped off
-            # 4. Turn that triplet into a tuple
-            # In this way, a flat list is iterated over in triplets without wasting memory by copying the whole list
-            bpy_mesh.normals_split_custom_set(tuple(zip(*(iter(clnors),) * 3)))
+            bpy_mesh.polygons.foreach_set("use_smooth", np.ones(len(bpy_mesh.polygons), dtype=bool))
+            bpy_mesh.normals_split_custom_set(clnors.reshape(-1, 3))
 
             bpy_mesh.use_auto_smooth = True
 
@@ -0,0 +1,66 @@
+import bpy
+
+
+class TextureRegistry:
+    """
+    Finds images and materials that were already imported, in this session
+    or in the open .blend, so identical textures are shared rather than
+    duplicated. Each image is tagged with a hash of its decoded pixels, and
+    each material with the hash of the texture it samples, as custom
+    properties.
+    """
+    hash_property = "dc_texture_hash"
+
+    def __init__(self):
+        self.images = {}
+        self.materials = {}
+        for bpy_img in bpy.data.images:
+            content_hash = bpy_img.get(self.hash_property)
+            if content_hash is not None:
+                self.images.setdefault(content_hash, bpy_img)
+        for bpy_mat in bpy.data.materials:
+            content_hash = bpy_mat.get(self.hash_property)
+            if content_hash is not None:
+                self.materials.setdefault(content_hash, bpy_mat)
+
+    def get_image(self, content_hash):
+        return self.__lookup(self.images, bpy.data.images, content_hash)
+
+    def add_image(self, content_hash, bpy_img):
+        bpy_img[self.hash_property] = content_hash
+        self.images[content_hash] = bpy_img
+
+    def get_material(self, bpy_img):
+        try:
+            content_hash = bpy_img.get(self.hash_property)
+        except ReferenceError:
+            return None
+        if content_hash is None:
+            return None
+        return self.__lookup(self.materials, bpy.data.materials, content_hash)
+
+    def add_material(self, bpy_img, bpy_mat):
+        content_hash = bpy_img.get(self.hash_property)
+        if content_hash is not None:
+            bpy_mat[self.hash_property] = content_hash
+            self.materials[content_hash] = bpy_mat
+
+    def __lookup(self, registered, collection, content_hash):
+        datablock = registered.get(content_hash)
+        if datablock is None:
+            return None
+        # Accessing a datablock that was deleted since it was registered
+        # raises a ReferenceError
+        try:
+            if collection.get(datablock.name) == datablock:
+                return datablock
+        except ReferenceError:
+            pass
+        # Evict the stale entry and rebuild it from any other datablock
+        # that carries the same hash
+        del registered[content_hash]
+        for datablock in collection:
+            if datablock.get(self.hash_property) == content_hash:
+                registered[content_hash] = datablock
+                return datablock
+        return None
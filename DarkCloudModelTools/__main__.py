@@ -0,0 +1,119 @@
+"""
+Converts Dark Cloud CHR files to glTF without Blender.
+
+Usage:
+    python -m DarkCloudModelTools INPUT OUTPUT [--jobs N] [--no-texture-cache]
+
+INPUT is a .chr file or a directory, which is searched recursively for .chr
+files. Each file is written to OUTPUT as a .gltf file at the same relative
+path, along with a .bin file of geometry and a .png file per texture.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .filetypes.CHR.Model import Model
+from .filetypes.IMG.TextureCache import TextureCache
+from .export.GLTFExport import export_model
+
+
+def find_chr_files(path):
+    if os.path.isfile(path):
+        return [path]
+    filepaths = []
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for filename in sorted(files):
+            if filename.lower().endswith(".chr"):
+                filepaths.append(os.path.join(root, filename))
+    return filepaths
+
+
+def convert_file(filepath, out_filepath, use_texture_cache=True):
+    """
+    Converts one CHR file to glTF. Returns the export statistics along with
+    the size of the input and the time taken.
+    """
+    start = time.perf_counter()
+    os.makedirs(os.path.dirname(out_filepath) or ".", exist_ok=True)
+    texture_cache = TextureCache.default() if use_texture_cache else None
+    model = Model.from_file(filepath, use_ndarrays=True, decode_textures=True, texture_cache=texture_cache)
+    stats = export_model(model, out_filepath)
+    stats["bytes"] = os.path.getsize(filepath)
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def output_path(filepath, in_root, out_root):
+    if os.path.isfile(in_root):
+        relpath = os.path.basename(filepath)
+    else:
+        relpath = os.path.relpath(filepath, in_root)
+    return os.path.join(out_root, os.path.splitext(relpath)[0] + ".gltf")
+
+
+def run(in_path, out_path, jobs=1, use_texture_cache=True, stream=sys.stderr):
+    filepaths = find_chr_files(in_path)
+    jobs = max(1, min(jobs, len(filepaths))) if filepaths else 1
+    totals = {}
+    failures = []
+    start = time.perf_counter()
+
+    def report(done, filepath, stats=None, error=None):
+        relpath = os.path.relpath(filepath, in_path) if os.path.isdir(in_path) else filepath
+        if error is not None:
+            failures.append((filepath, error))
+            print(f"[{done}/{len(filepaths)}] {relpath}: FAILED: {error}", file=stream)
+            return
+        for key, value in stats.items():
+            totals[key] = totals.get(key, 0) + value
+        megabytes = stats["bytes"] / 1024**2
+        print(f"[{done}/{len(filepaths)}] {relpath}: {megabytes:.2f} MB in {stats['seconds']:.2f}s "
+              f"({stats['meshes']} meshes, {stats['bones']} bones, {stats['textures']} textures)", file=stream)
+
+    tasks = [(filepath, output_path(filepath, in_path, out_path), use_texture_cache) for filepath in filepaths]
+    if jobs == 1:
+        for done, task in enumerate(tasks, 1):
+            try:
+                report(done, task[0], convert_file(*task))
+            except Exception as e:
+                report(done, task[0], error=e)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(convert_file, *task): task[0] for task in tasks}
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    report(done, futures[future], future.result())
+                except Exception as e:
+                    report(done, futures[future], error=e)
+
+    elapsed = time.perf_counter() - start
+    megabytes = totals.get("bytes", 0) / 1024**2
+    converted = len(filepaths) - len(failures)
+    print(f"Converted {converted}/{len(filepaths)} files ({megabytes:.2f} MB) in {elapsed:.2f}s with {jobs} job(s): "
+          f"{megabytes / elapsed if elapsed else 0.:.2f} MB/s, {converted / elapsed if elapsed else 0.:.2f} files/s", file=stream)
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m DarkCloudModelTools",
+                                     description="Converts Dark Cloud CHR files to glTF 2.0, with textures as PNG.")
+    parser.add_argument("input", help="A .chr file, or a directory to search for .chr files")
+    parser.add_argument("output", help="The directory to write the converted files to")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Number of files to convert in parallel; 0 uses every CPU (default: 1)")
+    parser.add_argument("--no-texture-cache", action="store_true",
+                        help="Decode every texture rather than reusing cached decodes")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.input):
+        parser.error(f"{args.input} does not exist")
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    failures = run(args.input, args.output, jobs, not args.no_texture_cache)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
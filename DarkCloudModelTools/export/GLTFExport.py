@@ -0,0 +1,267 @@
+import json
+import os
+
+import numpy as np
+
+from .PNGExport import encode_png
+
+
+# glTF accessor component types
+BYTE_TYPE   = 5121
+SHORT_TYPE  = 5123
+INT_TYPE    = 5125
+FLOAT_TYPE  = 5126
+# glTF bufferView targets
+ARRAY_BUFFER         = 34962
+ELEMENT_ARRAY_BUFFER = 34963
+
+component_dtypes = {BYTE_TYPE: np.uint8, SHORT_TYPE: np.uint16, INT_TYPE: np.uint32, FLOAT_TYPE: np.float32}
+accessor_widths  = {"SCALAR": 1, "VEC2": 2, "VEC3": 3, "VEC4": 4, "MAT4": 16}
+
+
+def export_model(model, filepath, texture_cache=None, png_compression=6):
+    """
+    Writes a Model as a glTF 2.0 file at 'filepath', with its binary data
+    in a .bin file beside it and every texture as a .png file beside it.
+    Each submodel becomes a node holding its skeleton and its meshes, and
+    the meshes are skinned to the skeleton's bones in their rest pose.
+    Textures that were not decoded yet are decoded, using 'texture_cache'
+    if given. Returns counts of what was written.
+    """
+    builder = GLTFBuilder(filepath, png_compression)
+    for submodel_idx, submodel in enumerate(model.submodels):
+        if submodel.textures is None:
+            submodel.decode_textures(texture_cache)
+        builder.add_submodel(f"submodel_{submodel_idx}", submodel)
+    builder.write()
+    return builder.stats
+
+
+class GLTFBuilder:
+    def __init__(self, filepath, png_compression=6):
+        self.filepath = filepath
+        self.directory, filename = os.path.split(filepath)
+        self.stem = os.path.splitext(filename)[0]
+        self.png_compression = png_compression
+
+        self.buffer = bytearray()
+        self.gltf = {
+            "asset": {"version": "2.0", "generator": "DarkCloudModelTools"},
+            "scene": 0,
+            "scenes": [{"nodes": []}],
+            "nodes": [],
+            "meshes": [],
+            "skins": [],
+            "materials": [],
+            "textures": [],
+            "images": [],
+            "samplers": [{"magFilter": 9729, "minFilter": 9987}],
+            "accessors": [],
+            "bufferViews": [],
+            "buffers": []
+        }
+        # Shared between submodels, so each distinct texture is written once
+        self.images = {}
+        self.image_names = set()
+        self.materials = {}
+        self.stats = {"submodels": 0, "bones": 0, "meshes": 0, "vertices": 0, "triangles": 0, "textures": 0}
+
+    def add_node(self, node, parent=None):
+        node_idx = len(self.gltf["nodes"])
+        self.gltf["nodes"].append(node)
+        if parent is None:
+            self.gltf["scenes"][0]["nodes"].append(node_idx)
+        else:
+            self.gltf["nodes"][parent].setdefault("children", []).append(node_idx)
+        return node_idx
+
+    def add_accessor(self, array, component_type, accessor_type, target=None, bounds=False):
+        data = np.ascontiguousarray(array, dtype=component_dtypes[component_type])
+        count = len(data)
+
+        # Every bufferView starts on a 4-byte boundary, which suits all
+        # of the component types in use
+        self.buffer.extend(b"\x00" * (-len(self.buffer) % 4))
+        view = {"buffer": 0, "byteOffset": len(self.buffer), "byteLength": data.nbytes}
+        if target is not None:
+            view["target"] = target
+        self.buffer.extend(data.tobytes())
+        self.gltf["bufferViews"].append(view)
+
+        accessor = {
+            "bufferView": len(self.gltf["bufferViews"]) - 1,
+            "componentType": component_type,
+            "count": count,
+            "type": accessor_type
+        }
+        if bounds and count:
+            columns = data.reshape(count, accessor_widths[accessor_type])
+            accessor["min"] = columns.min(axis=0).tolist()
+            accessor["max"] = columns.max(axis=0).tolist()
+        self.gltf["accessors"].append(accessor)
+        return len(self.gltf["accessors"]) - 1
+
+    def add_submodel(self, name, submodel):
+        root_idx = self.add_node({"name": name})
+        joints = self.add_skeleton(submodel.mds, root_idx)
+        skin_idx = None
+        if joints:
+            inverse_binds = np.linalg.inv(submodel.mds.skeleton.world_matrices())
+            skin_idx = len(self.gltf["skins"])
+            self.gltf["skins"].append({
+                "name": name,
+                "joints": joints,
+                "inverseBindMatrices": self.add_accessor(inverse_binds.reshape(-1, 16), FLOAT_TYPE, "MAT4")
+            })
+
+        textures = {tex_name: self.add_image(tex_name, ii) for tex_name, ii in submodel.textures.items()}
+        weights = submodel.generate_weights() if submodel.wgt is not None else {}
+        mesh_idx_to_bone_idx = submodel.mesh_idx_to_bone_idx()
+        for mesh_idx, mesh in enumerate(submodel.mds.meshes):
+            gltf_mesh = self.add_mesh(f"{name}_mesh_{mesh_idx}", mesh, textures,
+                                      len(joints), weights.get(mesh_idx), mesh_idx_to_bone_idx.get(mesh_idx))
+            if gltf_mesh is None:
+                continue
+            node = {"name": f"mesh_{mesh_idx}", "mesh": gltf_mesh}
+            if skin_idx is not None:
+                node["skin"] = skin_idx
+            self.add_node(node, root_idx)
+        self.stats["submodels"] += 1
+
+    def add_skeleton(self, mds, root_idx):
+        """
+        Adds a node per bone, parented as in the file, and returns the node
+        indices in bone order. The matrices are row-major with the
+        translation in the bottom row, which is exactly glTF's column-major
+        layout for the same transform.
+        """
+        skeleton = mds.skeleton
+        joints = [None] * len(mds.bones)
+        # Parents always come before their children in this order
+        for bone_idx in skeleton.order.tolist():
+            bone = mds.bones[bone_idx]
+            parent = bone.parent
+            joints[bone_idx] = self.add_node({
+                "name": bone.name,
+                "matrix": skeleton.local_matrices[bone_idx].reshape(-1).tolist()
+            }, root_idx if parent == -1 else joints[parent])
+        self.stats["bones"] += len(joints)
+        return joints
+
+    def add_image(self, tex_name, image_interface):
+        content_hash = image_interface.content_hash()
+        if content_hash in self.images:
+            return self.images[content_hash]
+
+        safe_name = "".join(c if c.isalnum() or c in "-_." else "_" for c in tex_name)
+        image_name = f"{self.stem}_{safe_name}"
+        suffix = 1
+        while image_name in self.image_names:
+            image_name = f"{self.stem}_{safe_name}_{suffix}"
+            suffix += 1
+        self.image_names.add(image_name)
+
+        with open(os.path.join(self.directory, image_name + ".png"), 'wb') as F:
+            F.write(encode_png(image_interface.pixels, image_interface.width, image_interface.height, self.png_compression))
+
+        self.gltf["images"].append({"name": tex_name, "uri": image_name + ".png"})
+        self.gltf["textures"].append({"sampler": 0, "source": len(self.gltf["images"]) - 1})
+        texture_idx = len(self.gltf["textures"]) - 1
+        self.images[content_hash] = texture_idx
+        self.stats["textures"] += 1
+        return texture_idx
+
+    def add_material(self, tex_name, texture_idx):
+        key = (tex_name, texture_idx)
+        if key not in self.materials:
+            pbr = {"metallicFactor": 0.}
+            if texture_idx is not None:
+                pbr["baseColorTexture"] = {"index": texture_idx}
+            self.gltf["materials"].append({"name": tex_name, "pbrMetallicRoughness": pbr, "alphaMode": "BLEND"})
+            self.materials[key] = len(self.gltf["materials"]) - 1
+        return self.materials[key]
+
+    def add_mesh(self, name, mesh, textures, n_joints, mesh_weights, mesh_bone_idx):
+        if not mesh.loop_count:
+            return None
+
+        # glTF attributes are per-vertex, so every distinct combination of
+        # vertex, normal and UV on the loops becomes one glTF vertex
+        keys = np.empty((mesh.loop_count, 6), np.float32)
+        keys[:, 0]   = mesh.loop_vertex.view(np.float32)
+        keys[:, 1:4] = mesh.loop_normal
+        keys[:, 4:6] = mesh.loop_uv
+        keys = np.ascontiguousarray(keys).view(np.dtype((np.void, keys.itemsize * 6))).reshape(-1)
+        _, first, loop_to_vertex = np.unique(keys, return_index=True, return_inverse=True)
+        loop_to_vertex = loop_to_vertex.reshape(-1)
+        vertex_indices = mesh.loop_vertex[first]
+
+        normals = mesh.loop_normal[first].astype(np.float32)
+        lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+        normals = np.where(lengths > 0, normals / np.where(lengths > 0, lengths, 1), np.float32([0, 0, 1]))
+
+        attributes = {
+            "POSITION":   self.add_accessor(mesh.positions[vertex_indices], FLOAT_TYPE, "VEC3", ARRAY_BUFFER, bounds=True),
+            "NORMAL":     self.add_accessor(normals, FLOAT_TYPE, "VEC3", ARRAY_BUFFER),
+            "TEXCOORD_0": self.add_accessor(mesh.loop_uv[first], FLOAT_TYPE, "VEC2", ARRAY_BUFFER)
+        }
+        if n_joints:
+            joints, weights = self.vertex_influences(len(mesh.positions), n_joints, mesh_weights, mesh_bone_idx)
+            joint_type = BYTE_TYPE if n_joints <= 256 else SHORT_TYPE
+            attributes["JOINTS_0"]  = self.add_accessor(joints[vertex_indices], joint_type, "VEC4", ARRAY_BUFFER)
+            attributes["WEIGHTS_0"] = self.add_accessor(weights[vertex_indices], FLOAT_TYPE, "VEC4", ARRAY_BUFFER)
+
+        # One primitive per material, since glTF has no per-face materials
+        triangles = loop_to_vertex.reshape(-1, 3)
+        index_type = SHORT_TYPE if len(first) <= 0xFFFF else INT_TYPE
+        primitives = []
+        for material_idx in np.unique(mesh.face_material).tolist():
+            tex_name = mesh.materials[material_idx].texture_name if material_idx < len(mesh.materials) else None
+            primitive = {
+                "attributes": attributes,
+                "indices": self.add_accessor(triangles[mesh.face_material == material_idx].reshape(-1), index_type, "SCALAR", ELEMENT_ARRAY_BUFFER),
+                "mode": 4
+            }
+            if tex_name is not None:
+                primitive["material"] = self.add_material(tex_name, textures.get(tex_name))
+            primitives.append(primitive)
+
+        self.gltf["meshes"].append({"name": name, "primitives": primitives})
+        self.stats["meshes"] += 1
+        self.stats["vertices"] += len(first)
+        self.stats["triangles"] += len(triangles)
+        return len(self.gltf["meshes"]) - 1
+
+    @staticmethod
+    def vertex_influences(n_vertices, n_joints, mesh_weights, mesh_bone_idx):
+        """
+        Returns the four strongest joints of each vertex and their weights,
+        normalised to sum to one, as (V, 4) arrays. Vertices without any
+        weights are bound to the mesh's own bone, as rigid meshes are.
+        """
+        dense = np.zeros((n_vertices, max(n_joints, 4)), np.float32)
+        if mesh_weights is not None:
+            for bone_idx, (indices, weights) in mesh_weights.items():
+                dense[indices, bone_idx] = weights
+        unweighted = ~dense.any(axis=1)
+        dense[unweighted, mesh_bone_idx if mesh_bone_idx is not None else 0] = 1.
+
+        joints = np.argpartition(-dense, 3, axis=1)[:, :4]
+        weights = np.take_along_axis(dense, joints, axis=1)
+        weights /= weights.sum(axis=1, keepdims=True)
+        joints[weights == 0] = 0
+        return joints, weights
+
+    def write(self):
+        if self.buffer:
+            bin_name = self.stem + ".bin"
+            with open(os.path.join(self.directory, bin_name), 'wb') as F:
+                F.write(self.buffer)
+            self.gltf["buffers"].append({"uri": bin_name, "byteLength": len(self.buffer)})
+
+        if not self.gltf["textures"]:
+            self.gltf["samplers"] = []
+        # glTF disallows empty arrays
+        gltf = {key: value for key, value in self.gltf.items() if value != []}
+        with open(self.filepath, 'w') as F:
+            json.dump(gltf, F, indent=1)
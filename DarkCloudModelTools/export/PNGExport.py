@@ -0,0 +1,39 @@
+import struct
+import zlib
+
+import numpy as np
+
+
+def encode_png(pixels, width, height, compression=6):
+    """
+    Encodes flat RGBA float pixels in [0, 1], as stored in
+    ImageInterface.pixels, as an 8-bit RGBA PNG. Rows are written in the
+    order they are stored.
+    """
+    rgba = np.clip(np.rint(np.asarray(pixels, np.float32) * 255), 0, 255).astype(np.uint8)
+    rows = rgba.reshape(height, width * 4)
+    # Every scanline starts with its filter type; 0 is no filtering
+    scanlines = np.zeros((height, width * 4 + 1), np.uint8)
+    scanlines[:, 1:] = rows
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return b"".join((
+        b"\x89PNG\r\n\x1a\n",
+        _chunk(b"IHDR", header),
+        _chunk(b"IDAT", zlib.compress(scanlines.tobytes(), compression)),
+        _chunk(b"IEND", b"")
+    ))
+
+
+def write_png(filepath, image_interface, compression=6):
+    with open(filepath, 'wb') as F:
+        F.write(encode_png(image_interface.pixels, image_interface.width, image_interface.height, compression))
+
+
+def _chunk(chunk_type, data):
+    return b"".join((
+        struct.pack(">I", len(data)),
+        chunk_type,
+        data,
+        struct.pack(">I", zlib.crc32(chunk_type + data))
+    ))
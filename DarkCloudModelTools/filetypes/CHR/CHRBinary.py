@@ -1,4 +1,4 @@
-import io
+from concurrent.futures import ProcessPoolExecutor
 
 from ..MOT.MOTBinary import MOTBinary
 from ..TXT.TXTBinary import TextBinary
@@ -7,41 +7,156 @@ from ..BBP.BBPBinary import BBPBinary
 from ..WGT.WGTBinary import WGTBinary
 from ..IMG.IMGBinary import IMGBinary
 from ..IMG.IMGBinary import IM2Binary
-from ...serialisation.BinaryTargets import Reader, Writer
 from ...serialisation.Serializable import Serializable
+from ...serialisation.BinaryTargets import Reader
 
 class CHRBinary(Serializable):
-    def __init__(self, context=None):
+    """
+    If 'lazy' is set, reading only walks the file headers; each subfile is
+    decoded the first time its 'file' attribute is accessed. Lazily-loaded
+    subfiles keep a view of the archive's buffer until they are decoded.
+    """
+    def __init__(self, context=None, lazy=False):
         super().__init__(context)
         
+        self.lazy  = lazy
         self.files = []
+        self.table = {}
         
     def __repr__(self):
         return f"[CHR] {self.files}"
     
+    def read(self, filepath, use_ndarrays=False, workers=None):
+        """
+        If 'workers' is greater than one, only the file headers are read
+        here; the subfiles are then decoded in a pool of that many
+        processes, each of which maps the archive itself and is sent nothing
+        but the offset of the subfile it should decode. A lazy archive only
+        decodes subfiles on access, so it cannot be given 'workers'; a
+        ValueError is raised if it is.
+        """
+        if workers is not None and workers > 1 and self.lazy:
+            raise ValueError("'workers' cannot be used when reading lazily")
+        if workers is None or workers <= 1:
+            return super().read(filepath, use_ndarrays)
+        
+        self.lazy = True
+        try:
+            super().read(filepath, use_ndarrays)
+        finally:
+            self.lazy = False
+            for file in self.files:
+                file.lazy = False
+            
+        pending = sorted((file for file in self.files if file.offset is not None),
+                         key=lambda file: file.file_size, reverse=True)
+        with ProcessPoolExecutor(workers) as pool:
+            futures = [pool.submit(read_subfile, filepath, file.offset - 0x50, use_ndarrays) for file in pending]
+            for file, future in zip(pending, futures):
+                file.file = future.result()
+    
+    def write(self, filepath):
+        # Undecoded payloads are views of the mapped source archive, which
+        # may be the very file being written, so take copies of them first
+        self.detach_payloads()
+        super().write(filepath)
+    
+    def detach_payloads(self):
+        """
+        Copies every undecoded payload out of the buffer it was read from,
+        so that the source file can be closed, replaced or deleted.
+        """
+        for file in self.files:
+            file.detach_payload()
+            
     def read_write(self, rw):
         if rw.mode() == "read":
             while rw.peek_bytestring(1) != b'':
-                file = self.File()
+                file = self.File(lazy=self.lazy)
                 rw.rw_obj(file)
                 self.files.append(file)
+                if file.offset is not None:
+                    self.table[file.name] = (file.offset, file.file_size)
         else:
             self.files = rw.rw_obj_array(self.files, self.File, len(self.files))
+            
+    @classmethod
+    def iter_files(cls, filepath, use_ndarrays=False):
+        """
+        Yields each File of the archive at 'filepath' in turn, with its
+        payload decoded lazily on access. Nothing is kept once the consumer
+        moves on to the next file, so memory use is bounded by what the
+        consumer holds on to rather than by the size of the archive.
+        """
+        with Reader(filepath, use_ndarrays=use_ndarrays) as rw:
+            yield from rw.iter_objs(lambda: cls.File(lazy=True))
+            
+    def get_file(self, name):
+        """
+        Returns the decoded subfile called 'name'. 'table' maps each name to
+        the (offset, size) of its data within the archive.
+        """
+        offset, _ = self.table[name]
+        for file in self.files:
+            if file.offset == offset:
+                return file.file
         
     class File(Serializable):
-        def __init__(self, context=None):
+        def __init__(self, context=None, lazy=False):
             super().__init__(context)
             
+            self.lazy           = lazy
             self.name_buffer    = None
             self.header_size    = 0x50
             self.file_size      = None
             self.next_file_jump = None
             self.unknown_0x0C   = None
+            self.offset         = None
             self.file           = None
             
+        @property
+        def name(self):
+            return self.name_buffer.split(b'\x00')[0].decode('ascii')
+            
+        @property
+        def file(self):
+            if self._payload is not None:
+                # Decode from a fresh Reader and only drop the payload once
+                # that succeeds, so a failed decode can be retried and the
+                # original bytes are still what gets written back
+                rw = self.open_payload()
+                file = self.__handle_file_parse(rw.peek_bytestring(min(4, self.file_size)))
+                if file is not None:
+                    rw.rw_obj(file)
+                self._file = file
+                self._payload = None
+            return self._file
+        
+        @file.setter
+        def file(self, value):
+            self._file = value
+            self._payload = None
+            
+        def is_loaded(self):
+            return self._payload is None
+        
+        def detach_payload(self):
+            if self._payload is not None:
+                self._payload = Reader(None, bytes(self._payload.buffer), self._payload.use_ndarrays)
+            elif isinstance(self._file, CHRBinary):
+                self._file.detach_payloads()
+        
+        def open_payload(self):
+            """
+            Returns a new Reader over the raw data of a file that has not been
+            decoded yet, e.g. to stream it with 'MOTBinary.iter_animations'.
+            """
+            if self._payload is None:
+                raise ValueError("The file has already been decoded")
+            return Reader(None, self._payload.buffer, self._payload.use_ndarrays)
+            
         def __repr__(self):
-            pad = b'\x00'
-            filename = self.name_buffer.split(pad)[0].decode('ascii') if self.name_buffer is not None else None
+            filename = self.name if self.name_buffer is not None else None
             return f"[CHR::File] {self.header_size} {self.file_size} {self.next_file_jump} {self.unknown_0x0C} {filename}"
     
         def read_write(self, rw):
@@ -55,61 +170,68 @@ class CHRBinary(Serializable):
                 return
             
             if rw.mode() == "read":
-                file_blob = rw.rw_bytestring(None, self.file_size)
-                rw.align(rw.tell(), 0x10)
-                self.__parse_file(file_blob)
+                self.offset = rw.tell()
+                if self.lazy:
+                    self._payload = rw.subreader(self.file_size)
+                else:
+                    self.file = self.__handle_file_parse(rw.peek_bytestring(min(4, self.file_size)))
+                    self.file = rw.rw_subfile(self.file, self.file_size)
+            elif not self.is_loaded():
+                # Never decoded, so the original bytes can be written back as-is
+                rw.rw_bytestring(self._payload.buffer, self.file_size)
             else:
-                file_blob = b''
-                file_blob = self.__unparse_file(file_blob)
-                rw.rw_bytestring(file_blob, self.file_size)
-                rw.align(rw.tell(), 0x10)
+                self.file = rw.rw_subfile(self.file, self.file_size)
+            rw.align(rw.tell(), 0x10)
 
         # Implement below methods on the Interface
-        def __handle_file_parse(self, rw, blob):
-            rw.bytestream = io.BytesIO(blob)
-
-            if rw.mode() == "read":
-                magic = rw.peek_bytestring(4)
-                nm = self.name_buffer.split(b'\x00')[0].decode('ascii')
-                ext = nm.rsplit('.', 1)[-1]
-                if ext == "mds":
-                    self.file = MDSBinary()
-                elif ext == "bbp":
-                    self.file = BBPBinary()
-                elif ext == "wgt":
-                    self.file = WGTBinary()
-                elif ext == "mot":
-                    self.file = MOTBinary()
-                elif ext == "cfg":
-                    self.file = TextBinary()
-                elif ext == "img":
-                    if magic == b"IMG\x00":
-                        self.file = IMGBinary()
-                    elif magic == b"IM2\x00":
-                        self.file = IM2Binary()
-                    else:
-                        raise NotImplementedError(f"Unknown texture type: {magic}")
-                elif ext == "clo":
-                    self.file = TextBinary()
-                elif ext == "chr":
-                    self.file = CHRBinary()
-                elif ext == "":
-                    pass
+        def __handle_file_parse(self, magic):
+            filetype = self.detect_type(magic)
+            if filetype is None:
+                return None
+            elif filetype is CHRBinary:
+                return CHRBinary(lazy=self.lazy)
+            return filetype()
+        
+        def detect_type(self, magic):
+            """
+            Returns the Binary class that the file's payload should be parsed
+            with, going by its extension and first four bytes 'magic'.
+            """
+            ext = self.name.rsplit('.', 1)[-1]
+            if ext == "mds":
+                return MDSBinary
+            elif ext == "bbp":
+                return BBPBinary
+            elif ext == "wgt":
+                return WGTBinary
+            elif ext == "mot":
+                return MOTBinary
+            elif ext == "cfg":
+                return TextBinary
+            elif ext == "img":
+                if magic == b"IMG\x00":
+                    return IMGBinary
+                elif magic == b"IM2\x00":
+                    return IM2Binary
                 else:
-                    raise NotImplementedError(f"Unknown file extension '{ext}'")
-            
-            if self.file is not None:
-                self.file = rw.rw_obj(self.file)
-            
-            if rw.mode() == "read":
-                return blob
+                    raise NotImplementedError(f"Unknown texture type: {magic}")
+            elif ext == "clo":
+                return TextBinary
+            elif ext == "chr":
+                return CHRBinary
+            elif ext == "":
+                return None
             else:
-                rw.bytestream.seek(0)
-                return rw.bytestream.read()
-                
-        def __parse_file(self, blob):
-            return self.__handle_file_parse(Reader(None), blob)
-            
-        def __unparse_file(self, blob):
-            return self.__handle_file_parse(Writer(None), blob)
-    
\ No newline at end of file
+                raise NotImplementedError(f"Unknown file extension '{ext}'")
+
+
+def read_subfile(filepath, header_offset, use_ndarrays=False):
+    """
+    Decodes the single CHR subfile whose header starts at 'header_offset'
+    in the archive at 'filepath', without reading the rest of the archive.
+    """
+    with Reader(filepath, use_ndarrays=use_ndarrays) as rw:
+        rw.seek(header_offset)
+        file = CHRBinary.File()
+        rw.rw_obj(file)
+    return file.file
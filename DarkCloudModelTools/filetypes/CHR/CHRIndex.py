@@ -0,0 +1,188 @@
+import hashlib
+import os
+import sqlite3
+
+from .CHRBinary import CHRBinary, read_subfile
+from ...serialisation.BinaryTargets import Reader
+
+
+class CHRIndex:
+    """
+    A persistent table of contents for every CHR archive under a directory.
+    For each subfile it stores the name, the offset and size of its data
+    within the archive, its detected Binary type, and a hash of its contents.
+    Archives are re-indexed when their modification time or size changes.
+
+    Usage:
+        with CHRIndex("chr_index.sqlite") as index:
+            index.update("path/to/data")
+            archives = index.archives_containing("c01a.img")
+            binary = index.open_subfile(archives[0], "c01a.img")
+    """
+    schema = """
+        CREATE TABLE IF NOT EXISTS archives (
+            id       INTEGER PRIMARY KEY,
+            path     TEXT UNIQUE NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            size     INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS files (
+            archive_id INTEGER NOT NULL REFERENCES archives(id) ON DELETE CASCADE,
+            name       TEXT NOT NULL,
+            offset     INTEGER NOT NULL,
+            size       INTEGER NOT NULL,
+            type       TEXT,
+            hash       TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS files_by_name ON files(name);
+        CREATE INDEX IF NOT EXISTS files_by_hash ON files(hash);
+        CREATE INDEX IF NOT EXISTS files_by_archive ON files(archive_id, name);
+    """
+
+    def __init__(self, filepath):
+        self.connection = sqlite3.connect(filepath)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(self.schema)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    ############
+    # Building #
+    ############
+
+    def update(self, root):
+        """
+        Indexes every '.chr' file under 'root' that is new or has changed
+        since it was last indexed, and forgets archives under 'root' that no
+        longer exist. Returns the number of archives that were (re-)indexed.
+        """
+        root = os.path.abspath(root)
+        found = set()
+        updated = 0
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                if filename.lower().endswith(".chr"):
+                    filepath = os.path.join(dirpath, filename)
+                    found.add(filepath)
+                    if self.refresh(filepath):
+                        updated += 1
+
+        # A prefix check rather than os.path.commonpath, which raises for
+        # archives indexed from another drive on Windows
+        prefix = os.path.join(os.path.normcase(root), '')
+        with self.connection:
+            for archive_id, filepath in self.connection.execute("SELECT id, path FROM archives").fetchall():
+                if os.path.normcase(filepath).startswith(prefix) and filepath not in found:
+                    self.connection.execute("DELETE FROM archives WHERE id = ?", (archive_id,))
+        return updated
+
+    def refresh(self, filepath):
+        """
+        Re-indexes 'filepath' if it is not yet indexed or is out of date.
+        Returns whether it was re-indexed.
+        """
+        filepath = os.path.abspath(filepath)
+        stat = os.stat(filepath)
+        row = self.connection.execute("SELECT mtime_ns, size FROM archives WHERE path = ?", (filepath,)).fetchone()
+        if row == (stat.st_mtime_ns, stat.st_size):
+            return False
+        self.index_archive(filepath, stat)
+        return True
+
+    def index_archive(self, filepath, stat=None):
+        filepath = os.path.abspath(filepath)
+        if stat is None:
+            stat = os.stat(filepath)
+
+        rows = []
+        with Reader(filepath) as rw:
+            binary = CHRBinary(lazy=True)
+            rw.rw_obj(binary)
+            for file in binary.files:
+                if file.offset is None:
+                    continue
+                rw.seek(file.offset)
+                data = rw.view_bytestring(file.file_size)
+                try:
+                    filetype = file.detect_type(bytes(data[:4]))
+                    filetype = filetype.__name__ if filetype is not None else None
+                except NotImplementedError:
+                    filetype = None
+                digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+                rows.append((file.name, file.offset, file.file_size, filetype, digest))
+                data.release()
+            del binary
+
+        with self.connection:
+            self.connection.execute("DELETE FROM archives WHERE path = ?", (filepath,))
+            cursor = self.connection.execute("INSERT INTO archives (path, mtime_ns, size) VALUES (?, ?, ?)",
+                                             (filepath, stat.st_mtime_ns, stat.st_size))
+            archive_id = cursor.lastrowid
+            self.connection.executemany("INSERT INTO files (archive_id, name, offset, size, type, hash) VALUES (?, ?, ?, ?, ?, ?)",
+                                        [(archive_id, *row) for row in rows])
+
+    ###########
+    # Lookups #
+    ###########
+
+    def archives(self):
+        return [row[0] for row in self.connection.execute("SELECT path FROM archives ORDER BY path")]
+
+    def files(self, filepath):
+        """
+        Returns (name, offset, size, type, hash) for each subfile of the
+        archive at 'filepath', in archive order.
+        """
+        return self.connection.execute("""
+            SELECT files.name, files.offset, files.size, files.type, files.hash
+            FROM files JOIN archives ON files.archive_id = archives.id
+            WHERE archives.path = ? ORDER BY files.offset
+        """, (os.path.abspath(filepath),)).fetchall()
+
+    def find(self, name):
+        """
+        Returns (archive path, offset, size, type, hash) for every subfile
+        called 'name'.
+        """
+        return self.connection.execute("""
+            SELECT archives.path, files.offset, files.size, files.type, files.hash
+            FROM files JOIN archives ON files.archive_id = archives.id
+            WHERE files.name = ? ORDER BY archives.path, files.offset
+        """, (name,)).fetchall()
+
+    def find_hash(self, digest):
+        """
+        Returns (archive path, name) for every subfile whose contents hash
+        to 'digest', i.e. every copy of the same file.
+        """
+        return self.connection.execute("""
+            SELECT archives.path, files.name
+            FROM files JOIN archives ON files.archive_id = archives.id
+            WHERE files.hash = ? ORDER BY archives.path, files.offset
+        """, (digest,)).fetchall()
+
+    def archives_containing(self, name):
+        return [row[0] for row in self.find(name)]
+
+    def open_subfile(self, filepath, name, use_ndarrays=False):
+        """
+        Decodes only the subfile 'name' of the archive at 'filepath' by
+        seeking straight to its header. The archive is re-indexed first if
+        it has changed on disk.
+        """
+        filepath = os.path.abspath(filepath)
+        self.refresh(filepath)
+        row = self.connection.execute("""
+            SELECT files.offset FROM files JOIN archives ON files.archive_id = archives.id
+            WHERE archives.path = ? AND files.name = ? ORDER BY files.offset LIMIT 1
+        """, (filepath, name)).fetchone()
+        if row is None:
+            raise KeyError(f"'{name}' is not in {filepath}")
+        return read_subfile(filepath, row[0] - 0x50, use_ndarrays)
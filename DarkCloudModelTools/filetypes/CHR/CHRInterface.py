@@ -1,3 +1,4 @@
+from collections.abc import Mapping
 from .CHRBinary import CHRBinary
 from ..CFG.CFGInterface import CFGInterface
 from ..MDS.MDSInterface import MDSInterface
@@ -7,9 +8,9 @@ class CHRInterface:
         self.files = {}
     
     @classmethod
-    def from_file(cls, filepath):
-        binary = CHRBinary()
-        binary.read(filepath)
+    def from_file(cls, filepath, use_ndarrays=False, lazy=False, workers=None):
+        binary = CHRBinary(lazy=lazy)
+        binary.read(filepath, use_ndarrays, workers)
         return cls.from_binary(binary)
         
     def to_file(self, filepath):
@@ -20,19 +21,52 @@ class CHRInterface:
     @classmethod
     def from_binary(cls, binary):
         instance = cls()
+        if binary.lazy:
+            instance.files = LazyFileTable(binary)
+            return instance
+        
         for file in binary.files:
-            name, _, _ = file.name_buffer.partition(b'\x00')
-            name = name.decode('ascii')
-            
-            # Messy, would prefer to be able to call a "to_interface" method
-            # on each Binary
-            if name.endswith(".cfg"):
-                instance.files[name] = CFGInterface.from_binary(file.file)
-            elif name.endswith(".mds"):
-                instance.files[name] = MDSInterface.from_binary(file.file)
-            else:
-                instance.files[name] = file.file
+            instance.files[file.name] = cls.file_to_interface(file.name, file.file)
         return instance
+    
+    @staticmethod
+    def file_to_interface(name, file):
+        # Messy, would prefer to be able to call a "to_interface" method
+        # on each Binary
+        if name.endswith(".cfg"):
+            return CFGInterface.from_binary(file)
+        elif name.endswith(".mds"):
+            return MDSInterface.from_binary(file)
+        else:
+            return file
         
     def to_binary(self):
         raise NotImplementedError
+
+
+class LazyFileTable(Mapping):
+    """
+    Read-only mapping of the files in a lazily-loaded CHRBinary. A file is
+    decoded and converted to its interface the first time it is looked up.
+    """
+    def __init__(self, binary):
+        self.binary = binary
+        self.names = [file.name for file in binary.files]
+        self.loaded = {}
+        
+    def __getitem__(self, name):
+        if name not in self.loaded:
+            if name in self.binary.table:
+                file = self.binary.get_file(name)
+            elif name in self.names:
+                file = None
+            else:
+                raise KeyError(name)
+            self.loaded[name] = CHRInterface.file_to_interface(name, file)
+        return self.loaded[name]
+    
+    def __iter__(self):
+        return iter(dict.fromkeys(self.names))
+    
+    def __len__(self):
+        return len(set(self.names))
@@ -1,19 +1,36 @@
+import numpy as np
+
 from .CHRInterface import CHRInterface
-from ..CFG.CFGInterface import CFGInterface
+from ..IMG.ImageInterface import ImageInterface
 
 class Model:
     def __init__(self):
         self.submodels = []
 
+    @classmethod
+    def from_file(cls, filepath, use_ndarrays=True, decode_textures=False, texture_cache=None):
+        """
+        Loads the model in a CHR file, only decoding the files its CFGs
+        refer to. With 'decode_textures', every texture is also decoded
+        into 'SubModel.textures'. Everything in the result can be pickled,
+        so this can run in a worker process.
+        """
+        instance = cls.from_chr(CHRInterface.from_file(filepath, use_ndarrays=use_ndarrays, lazy=True))
+        if decode_textures:
+            for submodel in instance.submodels:
+                submodel.decode_textures(texture_cache)
+        return instance
+
     @classmethod
     def from_chr(cls, chr_interface):
         instance = cls()
         
-        # Locate CFG files
+        # Locate CFG files by name, so that only the files they reference
+        # need decoding when the archive was loaded lazily
         cfgs = []
-        for nm, file in chr_interface.files.items():
-            if type(file) == CFGInterface:
-                cfgs.append(file)
+        for nm in chr_interface.files:
+            if nm.endswith(".cfg"):
+                cfgs.append(chr_interface.files[nm])
         
         for cfg in cfgs:
             submodel = SubModel()
@@ -36,3 +53,57 @@ class SubModel:
         self.wgt = None
         self.mot = None
         self.imgs = []
+        self.textures = None
+        
+    def decode_textures(self, cache=None):
+        """
+        Fills 'textures' with a dict mapping each texture name to its
+        decoded ImageInterface.
+        """
+        self.textures = {}
+        for img in self.imgs:
+            for tm2_record, tm2 in zip(img.image_records, img.image_data):
+                tm2_name = tm2_record.filename.partition(b'\x00')[0].decode('ascii')
+                assert len(tm2.images) == 1
+                self.textures[tm2_name] = ImageInterface.from_TM2(tm2.images[0], cache=cache)
+        return self.textures
+
+    def bone_idx_to_mesh_idx(self):
+        return {i: b.mdt_idx for i, b in enumerate(self.mds.bones)}
+
+    def mesh_idx_to_bone_idx(self):
+        return {m_idx : b_idx for b_idx, m_idx in self.bone_idx_to_mesh_idx().items()}
+
+    def generate_weights(self):
+        """
+        Returns {mesh_idx: {bone_idx: (vertex_indices, weights)}}, with the
+        vertex indices and weights of each bone as NumPy arrays. Zero
+        weights are dropped, and if a vertex is otherwise listed more than
+        once for a bone, the last weight wins.
+        """
+        bone_idx_to_mdt_idx = self.bone_idx_to_mesh_idx()
+        columns = {}
+        for vertex_group in self.wgt.groups:
+            mesh_idx = bone_idx_to_mdt_idx[vertex_group.meshbone_idx]
+            elements = vertex_group.elements
+            if hasattr(elements, "dtype"):
+                indices = elements.index.astype(np.int32)
+                weights = elements.weight.astype(np.float32)
+            else:
+                indices = np.fromiter((e.index for e in elements), np.int32, len(elements))
+                weights = np.fromiter((e.weight for e in elements), np.float32, len(elements))
+            columns.setdefault(mesh_idx, {}).setdefault(vertex_group.bone_idx, []).append((indices, weights))
+        
+        weights = {}
+        for mesh_idx, bone_columns in columns.items():
+            weights[mesh_idx] = {}
+            for bone_idx, parts in bone_columns.items():
+                indices = np.concatenate([part[0] for part in parts])
+                bone_weights = np.concatenate([part[1] for part in parts])
+                nonzero = bone_weights > 0
+                indices = indices[nonzero]
+                bone_weights = bone_weights[nonzero]
+                _, last = np.unique(indices[::-1], return_index=True)
+                keep = np.sort(len(indices) - 1 - last)
+                weights[mesh_idx][bone_idx] = (indices[keep], bone_weights[keep] / 100)
+        return weights
@@ -1,102 +1,178 @@
-import struct
+import hashlib
+
+import numpy as np
 
 class ImageInterface:
+    """
+    A decoded image. 'pixels' is a flat float32 array of RGBA values in row
+    order, i.e. 'width' * 'height' * 4 values, as Blender's image pixels
+    expect. 'mipmaps' holds the same for every level, starting with
+    'pixels', and 'palettes' holds every palette of an indexed image as a
+    (P, N, 4) array.
+    """
+    # image_colour_type -> bits per pixel, for palette-indexed formats
+    indexed_bpps = {4: 4, 5: 8}
+    # image_colour_type -> bytes per pixel, for direct colour formats
+    direct_colour_sizes = {1: 2, 2: 3, 3: 4}
+
     def __init__(self):
-        self.pixels = []
-        
+        self.width    = 0
+        self.height   = 0
+        self.pixels   = np.empty(0, np.float32)
+        self.mipmaps  = []
+        self.palettes = np.empty((0, 0, 4), np.float32)
+
     @classmethod
-    def from_TM2(cls, tm2):
+    def from_TM2(cls, tm2, palette_idx=0, cache=None):
+        """
+        Decodes every mipmap level of a TIM2Image. Indexed images are
+        coloured with palette 'palette_idx' of the CLUT. If a TextureCache
+        is given as 'cache', previously decoded images are loaded from it
+        and newly decoded ones are stored in it.
+        """
+        if cache is not None:
+            key = cache.key(tm2, palette_idx)
+            entry = cache.get(key)
+            if entry is not None:
+                try:
+                    return cls.from_arrays(entry)
+                except (KeyError, ValueError):
+                    # Loaded, but not a valid entry; decode it afresh
+                    cache.discard(key)
+            instance = cls.from_TM2(tm2, palette_idx)
+            cache.put(key, **instance.to_arrays())
+            return instance
+
         instance = cls()
-        
-        # Parse CLUT first, since it may be needed later
-        clut = cls.__parse_clut(tm2)
-        
-        # Now parse the image data        
+        instance.width  = tm2.header.image_width
+        instance.height = tm2.header.image_height
+
+        # Now parse the image data
         image_colour_type = tm2.header.image_colour_type
-        if image_colour_type == 5:
-            clut_indices = struct.unpack('B'*len(tm2.texture), tm2.texture)
-            instance.pixels = [clut[idx] for idx in clut_indices]
+        if image_colour_type in cls.indexed_bpps:
+            instance.palettes = cls.__parse_clut(tm2)
+            palette = instance.palettes[palette_idx]
+            bpp = cls.indexed_bpps[image_colour_type]
+            instance.mipmaps = [palette[unpack_indices(level, bpp)].reshape(-1) for level in tm2.texture]
+        elif image_colour_type in cls.direct_colour_sizes:
+            colour_size = cls.direct_colour_sizes[image_colour_type]
+            instance.mipmaps = [decode_colours(level, colour_size).reshape(-1) for level in tm2.texture]
         else:
             raise NotImplementedError(f"Unhandled TIM2 Image Colour Type: {image_colour_type}")
-            
+
+        if instance.mipmaps:
+            instance.pixels = instance.mipmaps[0]
         return instance
-            
+
     def to_TM2(self):
         raise NotImplementedError
-        
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        instance = cls()
+        instance.width, instance.height = arrays["size"].tolist()
+        instance.palettes = arrays["palettes"]
+        instance.mipmaps = [arrays[f"mipmap_{i}"] for i in range(len(arrays) - 2)]
+        if instance.mipmaps:
+            instance.pixels = instance.mipmaps[0]
+        return instance
+
+    def to_arrays(self):
+        arrays = {"size": np.array([self.width, self.height]), "palettes": self.palettes}
+        for i, mipmap in enumerate(self.mipmaps):
+            arrays[f"mipmap_{i}"] = mipmap
+        return arrays
+
+    def content_hash(self):
+        """
+        Returns a hex digest of the image's size and top-level pixels,
+        which identifies identical textures across files and tools.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{self.width}x{self.height}".encode('ascii'))
+        digest.update(np.ascontiguousarray(self.pixels).tobytes())
+        return digest.hexdigest()
+
     @staticmethod
     def __parse_clut(tm2):
+        """
+        Returns every palette in the CLUT as a (P, N, 4) float32 array of
+        RGBA colours.
+        """
         # Set up convenience variables
         is_linear = (tm2.header.clut_colour_type & 0x80) != 0
         clut_colour_type = tm2.header.clut_colour_type & 0x7F
         clut_colour_count = tm2.header.clut_colour_count
-        image_colour_type = tm2.header.image_colour_type
-        
+
         # Determine clut colour size
-        if image_colour_type == 5:
-            clut_colour_size = (clut_colour_type & 0x07) + 1
-        else:
-            raise NotImplementedError(f"Unhandled TIM2 Image Colour Type: {image_colour_type}")
-            
-        # Parse each palette
+        clut_colour_size = (clut_colour_type & 0x07) + 1
         palette_count = tm2.header.clut_size // (clut_colour_size * clut_colour_count)
-        palette_size = tm2.header.clut_size // palette_count
-        palettes = []
-        # Not sure how to handle multiple palettes yet...
-        assert palette_count == 1
-        for i in range(palette_count):
-            if clut_colour_size == 2: # 16BITLE_ABGR_5551 Format
-                palette_colour_count = palette_size//2
-                palette = struct.unpack('H'*palette_colour_count, tm2.clut)
-                for palette_idx, palette_value in enumerate(palette):
-                    colour = [None, None, None, None]
-                    colour[0] = ((palette_value >> 11) & 0x05) / 31
-                    colour[1] = ((palette_value >>  6) & 0x05) / 31
-                    colour[2] = ((palette_value >>  1) & 0x05) / 31
-                    colour[3] = ((palette_value >>  0) & 0x01) /  1
-                    palette[palette_idx] = colour
-            elif clut_colour_size == 3: # 24BIT_RGB Format
-                palette_colour_count = palette_size//3
-                palette = struct.unpack('B'*palette_colour_count*3, tm2.clut)
-                palette = [
-                    [a/255, b/255, c/255, 1.] 
-                    for a, b, c in zip(palette[0::3], 
-                                       palette[1::3], 
-                                       palette[2::3])
-                ]
-            elif clut_colour_size == 4: # 32BIT_RGBA Format
-                palette_colour_count = palette_size//4
-                palette = struct.unpack('B'*palette_colour_count*4, tm2.clut)
-                palette = [
-                    [a/255, b/255, c/255, d/255] 
-                    for a, b, c, d in zip(palette[0::4], 
-                                          palette[1::4], 
-                                          palette[2::4],
-                                          palette[3::4])
-                ]
-            else:
-                raise ValueError(f"Invalid CLUT colour count: {clut_colour_count}")
-                 
-            # If the palette is non-linear, unmap the colours
-            if (not is_linear):
-                parts   = palette_size // (32*4)
-                stripes = 2
-                colours = 8
-                blocks  = 2
-    
-                new_idx = 0
-                new_palette = [None]*len(palette)
-                for part in range(parts):
-                    for block in range(blocks):
-                        for stripe in range(stripes):
-                            for colour in range(colours):
-                                old_idx  = part * colours * stripes * blocks
-                                old_idx += block * colours
-                                old_idx += stripe * stripes * colours
-                                old_idx += colour
-                                new_palette[new_idx] = palette[old_idx]
-                                new_idx += 1
-                palette = new_palette
-            palettes.append(palette)
-        return palettes[0]
-                    
\ No newline at end of file
+        palette_bytes = palette_count * clut_colour_count * clut_colour_size
+        colours = decode_colours(tm2.clut[:palette_bytes], clut_colour_size)
+        palettes = colours.reshape(palette_count, clut_colour_count, 4)
+
+        # If the palettes are non-linear, unmap the colours
+        if not is_linear:
+            palettes = palettes[:, csm1_permutation(clut_colour_count)]
+        return palettes
+
+
+def unpack_indices(data, bpp):
+    """
+    Unpacks 4- or 8-bit palette indices. 4-bit indices are packed two to a
+    byte, with the first pixel in the low nibble.
+    """
+    packed = np.frombuffer(data, np.uint8)
+    if bpp == 8:
+        return packed
+    elif bpp == 4:
+        indices = np.empty(2*len(packed), np.uint8)
+        indices[0::2] = packed & 0x0F
+        indices[1::2] = packed >> 4
+        return indices
+    else:
+        raise ValueError(f"Invalid index size: {bpp} bits")
+
+
+def decode_colours(data, colour_size):
+    """
+    Decodes packed PS2 colours of 'colour_size' bytes each, as found in
+    CLUTs and direct colour images, into an (N, 4) float32 array of RGBA
+    values in [0, 1].
+    """
+    if colour_size == 2: # 16BITLE_ABGR_5551 Format
+        values = np.frombuffer(data, "<u2")
+        colours = np.empty((len(values), 4), np.float32)
+        colours[:, 0] = (values       ) & 0x1F
+        colours[:, 1] = (values >>  5) & 0x1F
+        colours[:, 2] = (values >> 10) & 0x1F
+        colours[:, :3] /= 31
+        colours[:, 3] = values >> 15
+    elif colour_size == 3: # 24BIT_RGB Format
+        values = np.frombuffer(data, np.uint8).reshape(-1, 3)
+        colours = np.ones((len(values), 4), np.float32)
+        colours[:, :3] = values / np.float32(255)
+    elif colour_size == 4: # 32BIT_RGBA Format
+        values = np.frombuffer(data, np.uint8).reshape(-1, 4)
+        colours = values / np.float32(255)
+    else:
+        raise ValueError(f"Invalid colour size: {colour_size}")
+    return colours
+
+
+_csm1_permutations = {}
+
+
+def csm1_permutation(count):
+    """
+    Returns the index array that unmaps a CSM1-ordered palette of 'count'
+    colours. Within every block of 32 colours, colours 8-15 and 16-23 are
+    stored swapped. Palettes of fewer than 32 colours are not reordered.
+    """
+    permutation = _csm1_permutations.get(count)
+    if permutation is None:
+        permutation = np.arange(count)
+        if count >= 32:
+            permutation = (permutation & ~0x18) | ((permutation & 0x08) << 1) | ((permutation & 0x10) >> 1)
+        _csm1_permutations[count] = permutation
+    return permutation
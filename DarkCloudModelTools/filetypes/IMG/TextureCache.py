@@ -0,0 +1,133 @@
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+
+class TextureCache:
+    """
+    An on-disk cache of decoded TIM2 images, keyed by a hash of the raw
+    texture and CLUT bytes together with the header fields that affect
+    decoding. Entries are stored as compressed .npz files. Once the cache
+    grows past 'max_size' bytes, the least recently used entries are
+    deleted.
+
+    Usage:
+        cache = TextureCache.default()
+        image = ImageInterface.from_TM2(tm2, cache=cache)
+    """
+    # Bump whenever the decoded output of ImageInterface changes
+    version = 1
+    extension = ".npz"
+
+    def __init__(self, directory, max_size=512*1024**2):
+        self.directory = directory
+        self.max_size = max_size
+        self.size = None
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def default(cls, max_size=512*1024**2):
+        return cls(os.path.join(tempfile.gettempdir(), "DarkCloudModelTools", "texture_cache"), max_size)
+
+    def key(self, tm2, palette_idx=0):
+        header = tm2.header
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(repr((self.version, palette_idx,
+                            header.image_colour_type, header.clut_colour_type, header.clut_colour_count,
+                            header.clut_size, header.image_width, header.image_height,
+                            [len(level) for level in tm2.texture])).encode('ascii'))
+        for level in tm2.texture:
+            digest.update(level)
+        digest.update(tm2.clut)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.extension)
+
+    def get(self, key):
+        """
+        Returns the cached arrays for 'key' as a dict, or None on a miss.
+        Entries that cannot be loaded are deleted and count as misses.
+        """
+        filepath = self.path(key)
+        try:
+            with np.load(filepath) as data:
+                entry = {name: data[name] for name in data.files}
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # Truncated or corrupt, e.g. by a full disk or an older
+            # version of the cache; rebuild it on the next put
+            self.discard(key)
+            return None
+        # Mark the entry as recently used
+        try:
+            os.utime(filepath)
+        except OSError:
+            pass
+        return entry
+
+    def put(self, key, **arrays):
+        filepath = self.path(key)
+        # Write to a temporary file first, so that other processes sharing
+        # the cache never see a partial entry
+        fd, temp_path = tempfile.mkstemp(suffix=self.extension, dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as F:
+                np.savez_compressed(F, **arrays)
+            # An existing entry for the key is replaced, so stop counting it
+            try:
+                old_size = os.path.getsize(filepath)
+            except OSError:
+                old_size = 0
+            os.replace(temp_path, filepath)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+        if self.size is None:
+            self.size = sum(size for _, _, size in self.__entries())
+        else:
+            self.size += os.path.getsize(filepath) - old_size
+        if self.size > self.max_size:
+            self.evict()
+
+    def discard(self, key):
+        """
+        Deletes the entry for 'key', if there is one.
+        """
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+        self.size = None
+
+    def evict(self):
+        """
+        Deletes the least recently used entries until the cache fits in
+        'max_size'.
+        """
+        entries = sorted(self.__entries(), key=lambda entry: entry[1])
+        self.size = sum(size for _, _, size in entries)
+        for filepath, _, size in entries:
+            if self.size <= self.max_size:
+                break
+            try:
+                os.remove(filepath)
+            except OSError:
+                continue
+            self.size -= size
+
+    def clear(self):
+        for filepath, _, _ in self.__entries():
+            os.remove(filepath)
+        self.size = 0
+
+    def __entries(self):
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(self.extension) and entry.is_file():
+                    stat = entry.stat()
+                    yield entry.path, stat.st_mtime_ns, stat.st_size
@@ -1,18 +1,31 @@
 import importlib
 import sys
 
+import numpy as np
+
 from .MDSBinary import MDSBinary
 from .MDSBinary import MDT
+from .Skeleton import Skeleton
     
 class MDSInterface:
     def __init__(self):
         self.bones = []
         self.meshes = []
+        self._skeleton = None
+        
+    @property
+    def skeleton(self):
+        """
+        The Skeleton built from 'bones', computed on first access.
+        """
+        if self._skeleton is None:
+            self._skeleton = Skeleton.from_bones(self.bones)
+        return self._skeleton
         
     @classmethod
-    def from_file(cls, filepath):
+    def from_file(cls, filepath, use_ndarrays=False):
         mds = MDSBinary()
-        mds.read(filepath)
+        mds.read(filepath, use_ndarrays)
         return cls.from_binary(mds)
     
     def to_file(self, filepath):
@@ -51,45 +64,135 @@ class BoneInterface:
         raise NotImplementedError
         
 class MDTInterface:
+    """
+    A mesh stored as contiguous arrays, in the layout Blender's foreach_set
+    takes:
+        positions     - (V, 3) float32 vertex positions
+        loop_vertex   - (L,) int32 vertex index of each face corner
+        loop_normal   - (L, 3) float32 normal of each face corner
+        loop_uv       - (L, 2) float32 UV of each face corner
+        face_material - (F,) int32 material index of each triangle
+        face_strip    - (F,) int32 index of the strip each triangle came from
+        strips        - (S,) structured array of the original strip headers
+    Every face is a triangle, so face 'i' owns loops 3*i to 3*i + 2.
+    """
+    strip_dtype = np.dtype([("type", np.uint16), ("is_wide_vertex", np.uint16),
+                            ("vertex_count", np.uint32), ("material_idx", np.uint32)])
+    
     def __init__(self):
-        self.vertices  = []
-        self.faces     = []
-        self.materials = []
+        self.positions     = np.empty((0, 3), np.float32)
+        self.loop_vertex   = np.empty(0, np.int32)
+        self.loop_normal   = np.empty((0, 3), np.float32)
+        self.loop_uv       = np.empty((0, 2), np.float32)
+        self.face_material = np.empty(0, np.int32)
+        self.face_strip    = np.empty(0, np.int32)
+        self.strips        = np.empty(0, self.strip_dtype)
+        self.materials     = []
     
     @classmethod
     def from_binary(cls, mdt):
         instance = cls()
         
-        instance.vertices = [v[:3] for v in mdt.positions]
-        normals = [list(p[:3]) for p in mdt.normals]
-        uvs     = [list(p[:2]) for p in mdt.UVs]
+        instance.positions = np.ascontiguousarray(np.asarray(mdt.positions, np.float32).reshape(-1, 4)[:, :3])
+        normals = np.asarray(mdt.normals, np.float32).reshape(-1, 4)[:, :3]
+        uvs     = np.asarray(mdt.UVs, np.float32).reshape(-1, 4)[:, :2]
         instance.materials = [Material.from_binary(m) for m in mdt.materials]
+        instance.strips = np.array([(s.type, s.is_wide_vertex, s.vertex_count, s.material_idx) for s in mdt.faces.strips],
+                                   cls.strip_dtype)
         
         # Generate faces
-        instance.faces = []
-        for element in mdt.faces.strips:
-            if element.type == 3: # Triangles
-                for a, b, c in zip(element.indices[::3], element.indices[1::3], element.indices[2::3]):
-                    instance.faces.append(cls.__make_face(a, b, c, normals, uvs, element))
-            elif element.type == 4: # Triangle strips
-                for idx, (a, b, c) in enumerate(zip(element.indices, element.indices[1:], element.indices[2:])):
-                    if idx % 2 == 0:
-                        instance.faces.append(cls.__make_face(a, b, c, normals, uvs, element))
-                    else:
-                        instance.faces.append(cls.__make_face(b, a, c, normals, uvs, element))
-            else:
-                raise NotImplementedError
+        indices, corners, face_strips, face_materials = expand_strips(mdt.faces.strips)
+        loop_indices = indices[corners.reshape(-1)]
+        instance.loop_vertex   = loop_indices[:, 0].astype(np.int32)
+        instance.loop_normal   = normals[loop_indices[:, 1]]
+        instance.loop_uv       = uvs[loop_indices[:, 2]]
+        instance.face_material = face_materials.astype(np.int32)
+        instance.face_strip    = face_strips.astype(np.int32)
         return instance
     
     def to_binary(self):
         raise NotImplementedError
-        
-    @staticmethod
-    def __make_face(a, b, c, normals, uvs, element):
-        loop_1 = Loop(a[0], normals[a[1]], uvs[a[2]])
-        loop_2 = Loop(b[0], normals[b[1]], uvs[b[2]])
-        loop_3 = Loop(c[0], normals[c[1]], uvs[c[2]])
-        return Face(loop_1, loop_2, loop_3, element.material_idx)
+    
+    @property
+    def vertices(self):
+        return self.positions.tolist()
+    
+    @property
+    def faces(self):
+        """
+        The mesh as a list of Face objects. These are built on each access,
+        so prefer the arrays where possible.
+        """
+        loops = [Loop(v, n, uv) for v, n, uv in zip(self.loop_vertex.tolist(), self.loop_normal.tolist(), self.loop_uv.tolist())]
+        return [Face(*loops[3*i:3*i + 3], material_idx) for i, material_idx in enumerate(self.face_material.tolist())]
+    
+    @property
+    def face_count(self):
+        return len(self.face_material)
+    
+    @property
+    def loop_count(self):
+        return len(self.loop_vertex)
+
+
+def expand_strips(strips):
+    """
+    Expands the triangle lists (type 3) and triangle strips (type 4) in
+    'strips' into individual triangles in a single vectorised pass.
+    Returns:
+        indices        - (N, 3) array of the (position, normal, UV) index
+                         rows of every strip, concatenated in order
+        corners        - (F, 3) array of rows of 'indices' making up each
+                         triangle, with every other strip triangle flipped
+                         so that all faces share the same winding
+        face_strips    - (F,) array of the index in 'strips' of the strip
+                         each triangle came from
+        face_materials - (F,) array of the material index of each triangle
+    Triangles that use the same position more than once are dropped.
+    """
+    rows = []
+    strip_idxs = []
+    types = []
+    counts = []
+    materials = []
+    for strip_idx, strip in enumerate(strips):
+        if strip.type not in (3, 4):
+            raise NotImplementedError(f"Unknown strip type {strip.type}")
+        if strip.vertex_count == 0:
+            continue
+        strip_indices = np.asarray(strip.indices, dtype=np.int64).reshape(strip.vertex_count, -1)
+        rows.append(strip_indices[:, :3])
+        strip_idxs.append(strip_idx)
+        types.append(strip.type)
+        counts.append(strip.vertex_count)
+        materials.append(strip.material_idx)
+    
+    if not rows:
+        return np.empty((0, 3), np.int64), np.empty((0, 3), np.int64), np.empty(0, np.int64), np.empty(0, np.int64)
+    indices = np.concatenate(rows)
+    types = np.array(types)
+    counts = np.array(counts)
+    is_list = types == 3
+    
+    # Number of triangles in each strip, and where each one's rows start
+    tri_counts = np.where(is_list, counts // 3, np.maximum(counts - 2, 0))
+    row_starts = np.cumsum(counts) - counts
+    tri_starts = np.cumsum(tri_counts) - tri_counts
+    
+    strip_of_tri = np.repeat(np.arange(len(counts)), tri_counts)
+    local_idx = np.arange(tri_counts.sum()) - tri_starts[strip_of_tri]
+    tri_is_list = is_list[strip_of_tri]
+    first_row = row_starts[strip_of_tri] + np.where(tri_is_list, 3*local_idx, local_idx)
+    corners = first_row[:, None] + np.arange(3)
+    
+    # Odd triangles of a strip are wound the other way round
+    flipped = ~tri_is_list & (local_idx % 2 == 1)
+    corners[flipped, :2] = corners[flipped, 1::-1]
+    
+    positions = indices[corners, 0]
+    keep = (positions[:, 0] != positions[:, 1]) & (positions[:, 1] != positions[:, 2]) & (positions[:, 0] != positions[:, 2])
+    return indices, corners[keep], np.array(strip_idxs)[strip_of_tri][keep], np.array(materials)[strip_of_tri][keep]
+
 
 class Face:
     __slots__ = ("loop_1", "loop_2", "loop_3", "material_idx")
@@ -0,0 +1,112 @@
+import numpy as np
+
+
+class Skeleton:
+    """
+    The bone hierarchy of a model, with every bone's local matrix stacked
+    into an (N, 4, 4) array. Matrices are row-major with the translation in
+    the bottom row, so a bone's world matrix is 'local @ parent_world'.
+    World matrices are computed one hierarchy level at a time, with a
+    single batched matmul per level, and cached.
+    """
+    def __init__(self, parents, local_matrices):
+        self.parents = np.asarray(parents, dtype=np.int64)
+        self.local_matrices = np.asarray(local_matrices, dtype=np.float64).reshape(-1, 4, 4)
+        self.depths = self.__calc_depths(self.parents)
+        # Stable sort, so bones on the same level keep their file order
+        self.order = np.argsort(self.depths, kind="stable")
+        self._world_matrices = None
+
+    @classmethod
+    def from_bones(cls, bones):
+        """
+        Builds a Skeleton from anything with 'parent' and 'matrix'
+        attributes, e.g. MDSBinary's Bones or MDSInterface's BoneInterfaces.
+        """
+        return cls([bone.parent for bone in bones], [bone.matrix for bone in bones])
+
+    def __len__(self):
+        return len(self.parents)
+
+    @staticmethod
+    def __calc_depths(parents):
+        count = len(parents)
+        if np.any((parents < -1) | (parents >= count)):
+            raise ValueError("Bone parent index is out of range")
+        is_root = parents == -1
+        safe_parents = np.where(is_root, 0, parents)
+        depths = np.zeros(count, dtype=np.int64)
+        # Each pass settles one more level of the hierarchy
+        for _ in range(count + 1):
+            new_depths = np.where(is_root, 0, depths[safe_parents] + 1)
+            if np.array_equal(new_depths, depths):
+                return depths
+            depths = new_depths
+        raise ValueError("Bone hierarchy contains a cycle")
+
+    def world_matrices(self):
+        if self._world_matrices is None:
+            world = self.local_matrices.copy()
+            for depth in range(1, int(self.depths.max(initial=0)) + 1):
+                level = np.flatnonzero(self.depths == depth)
+                world[level] = self.local_matrices[level] @ world[self.parents[level]]
+            self._world_matrices = world
+        return self._world_matrices
+
+    def head_tail_roll(self):
+        """
+        Returns the (N, 3) heads, (N, 3) tails and (N,) rolls of Blender
+        edit bones matching the world matrices. The head is the world
+        translation, the tail is offset from it by the matrix's second
+        column, and the roll is the one that Blender's vec_roll_to_mat3
+        would need to rebuild the rotation around that axis.
+        """
+        world = self.world_matrices()
+        rotations = world[:, :3, :3]
+        heads = world[:, 3, :3]
+        vecs = rotations[:, :, 1]
+        tails = heads + vecs
+
+        # Rotation taking the bone's rest axis (+Y) onto its actual axis
+        target = np.array([0., 0.1, 0.])
+        nors = vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+        axes = np.cross(target, nors)
+        axis_sq_lengths = np.einsum("ij,ij->i", axes, axes)
+        rotated = axis_sq_lengths > 1e-10
+        axes[rotated] /= np.sqrt(axis_sq_lengths[rotated])[:, None]
+        thetas = np.arccos(np.clip(nors @ target / np.linalg.norm(target), -1., 1.))
+        b_matrices = axis_angle_matrices(axes, thetas)
+
+        # Bones along +/-Y: flip X and Y for -Y, leave Z as it is
+        updown = np.where(nors[:, 1] > 0, 1., -1.)
+        b_matrices[~rotated] = 0.
+        b_matrices[~rotated, 0, 0] = updown[~rotated]
+        b_matrices[~rotated, 1, 1] = updown[~rotated]
+        b_matrices[~rotated, 2, 2] = 1.
+
+        # b_matrices are orthonormal, so their inverse is their transpose
+        roll_matrices = np.transpose(b_matrices, (0, 2, 1)) @ rotations
+        rolls = np.arctan2(roll_matrices[:, 0, 2], roll_matrices[:, 2, 2])
+        return heads, tails, rolls
+
+
+def axis_angle_matrices(axes, angles):
+    """
+    Returns (N, 3, 3) matrices rotating by 'angles' about the unit 'axes',
+    as mathutils.Matrix.Rotation does.
+    """
+    x, y, z = axes[:, 0], axes[:, 1], axes[:, 2]
+    c = np.cos(angles)
+    s = np.sin(angles)
+    t = 1 - c
+    matrices = np.empty((len(axes), 3, 3))
+    matrices[:, 0, 0] = t*x*x + c
+    matrices[:, 0, 1] = t*x*y - s*z
+    matrices[:, 0, 2] = t*x*z + s*y
+    matrices[:, 1, 0] = t*x*y + s*z
+    matrices[:, 1, 1] = t*y*y + c
+    matrices[:, 1, 2] = t*y*z - s*x
+    matrices[:, 2, 0] = t*x*z - s*y
+    matrices[:, 2, 1] = t*y*z + s*x
+    matrices[:, 2, 2] = t*z*z + c
+    return matrices
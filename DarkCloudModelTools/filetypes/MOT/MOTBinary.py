@@ -1,4 +1,5 @@
 from ...serialisation.Serializable import Serializable
+from ...serialisation.BinaryTargets import Reader
 
 class MOTBinary(Serializable):
     def __init__(self, context=None):
@@ -11,13 +12,21 @@ class MOTBinary(Serializable):
 
     def read_write(self, rw):
         if rw.mode() == "read":
-            while rw.peek_bytestring(1) != b'':
-                anim = self.Animation()
-                rw.rw_obj(anim)
-                self.animations.append(anim)
+            self.animations.extend(rw.iter_objs(self.Animation))
         else:
             self.animations = rw.rw_obj_array(self.animations, self.Animation, len(self.animations))
             
+    @classmethod
+    def iter_animations(cls, source, use_ndarrays=False):
+        """
+        Yields the animations of a MOT file one at a time, without keeping
+        earlier ones alive. 'source' is either a filepath or a Reader over
+        the MOT data, such as one from 'CHRBinary.File.open_payload'.
+        """
+        rw = source if isinstance(source, Reader) else Reader(source, use_ndarrays=use_ndarrays)
+        with rw:
+            yield from rw.iter_objs(cls.Animation)
+            
     class Animation(Serializable):
         def __init__(self, context=None):
             super().__init__(context)
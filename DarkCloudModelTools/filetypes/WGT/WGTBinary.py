@@ -1,4 +1,5 @@
 from ...serialisation.Serializable import Serializable
+from ...serialisation.BinaryTargets import Reader
 
 class WGTBinary(Serializable):
     def __init__(self, context=None):
@@ -11,13 +12,20 @@ class WGTBinary(Serializable):
     
     def read_write(self, rw):
         if rw.mode() == "read":
-            self.groups = []
-            while rw.peek_bytestring(1) != b'':
-                group = self.VertexGroup()
-                rw.rw_obj(group)
-                self.groups.append(group)
+            self.groups = list(rw.iter_objs(self.VertexGroup))
         else:
             self.groups = rw.rw_obj_array(self.groups, self.VertexGroup, len(self.groups))
+            
+    @classmethod
+    def iter_groups(cls, source, use_ndarrays=False):
+        """
+        Yields the vertex groups of a WGT file one at a time, without keeping
+        earlier ones alive. 'source' is either a filepath or a Reader over
+        the WGT data, such as one from 'CHRBinary.File.open_payload'.
+        """
+        rw = source if isinstance(source, Reader) else Reader(source, use_ndarrays=use_ndarrays)
+        with rw:
+            yield from rw.iter_objs(cls.VertexGroup)
         
     class VertexGroup(Serializable):
         def __init__(self, context=None):
@@ -1,9 +1,66 @@
 import array
+import mmap
+import os
+import stat
 import struct
+import sys
+
+try:
+    import numpy as np
+except ImportError:  # Only needed for the ndarray modes
+    np = None
 
 from .utils import chunk_list, flatten_list
 
 
+# Runs of more than this many values skip struct and go through array
+BULK_THRESHOLD = 64
+
+_struct_cache = {}
+_native_endianness = '<' if sys.byteorder == "little" else '>'
+
+
+def get_struct(endianness, typecode, count=1):
+    """
+    Returns a compiled struct.Struct for 'count' values of 'typecode'.
+    Structs are shared between every BinaryTarget.
+    """
+    key = (endianness, typecode, count)
+    compiled = _struct_cache.get(key)
+    if compiled is None:
+        compiled = struct.Struct(f"{endianness}{count}{typecode}")
+        _struct_cache[key] = compiled
+    return compiled
+
+
+_compiled_records = {}
+
+
+def get_compiled_record(cls, endianness):
+    """
+    Returns the CompiledRecord for a Serializable class, or None if the
+    class does not have a fixed layout. Classes are traced on first use.
+    """
+    key = (cls, endianness)
+    try:
+        return _compiled_records[key]
+    except KeyError:
+        from .RecordCompiler import compile_record
+        record = _compiled_records[key] = compile_record(cls, endianness)
+        return record
+
+
+def _to_dtype(endianness, typecode):
+    endianness = {'!': '>', '@': '='}.get(endianness, endianness)
+    return np.dtype(endianness + typecode)
+
+
+def _needs_byteswap(endianness):
+    if endianness == '!':
+        endianness = '>'
+    return endianness in "<>" and endianness != _native_endianness
+
+
 class Context:
     __slots__ = ("endianness")
 
@@ -80,7 +137,7 @@ class BinaryTargetBase:
     def align_with(self, offset, alignment, typecode, value, endianness=None):
         if endianness is None:
             endianness = self.context.endianness
-        padval = struct.pack(endianness + typecode, value)
+        padval = get_struct(endianness, typecode).pack(value)
         self.align(offset, alignment, padval)
 
     def align_to(self, offset, width, typecode, value, endianness=None):
@@ -218,6 +275,13 @@ class BinaryTargetBase:
     def rw_obj_array(self, value, obj_constructor, shape, validator=None, *args, **kwargs):
         raise NotImplementedError
 
+    def rw_subfile(self, obj, size):
+        """
+        Operates on 'obj' as a self-contained file of 'size' bytes, starting
+        at the current position, then moves past it.
+        """
+        raise NotImplementedError
+
     def align(self, offset, alignment, padval=b'\x00'):
         raise NotImplementedError
 
@@ -228,18 +292,92 @@ class BinaryTargetBase:
         raise NotImplementedError
 
 
+# Typecodes that array can bulk-convert with the same item size as struct
+_array_typecodes = {tc for tc in "bBhHiIqQfd" if array.array(tc).itemsize == BinaryTargetBase.type_sizes[tc]}
+
+
 class Reader(BinaryTargetBase):
+    """
+    Reads from an in-memory buffer. When given a filename, the file is
+    memory-mapped on entering the context, so fields are decoded straight
+    out of the page cache with no intermediate copies. Nested data can be
+    handed off to a sub-Reader that shares the same buffer.
+    If 'use_ndarrays' is set, the rw_*s functions return NumPy arrays of the
+    requested shape instead of (nested) lists of arrays, and arrays of
+    fixed-layout records are returned as NumPy record arrays.
+    """
+    __slots__ = ("buffer", "cursor", "use_ndarrays", "_mmap")
+
     open_flags = "rb"
 
+    def __init__(self, filename, buffer=None, use_ndarrays=False):
+        super().__init__(filename)
+        if use_ndarrays and np is None:
+            raise ImportError("NumPy is required to read into ndarrays")
+        self.buffer = None if buffer is None else memoryview(buffer)
+        self.cursor = 0
+        self.use_ndarrays = use_ndarrays
+        self._mmap = None
+
+    def __enter__(self):
+        if self.buffer is None:
+            self.bytestream = open(self.filename, self.open_flags)
+            # Empty files cannot be mapped
+            if os.fstat(self.bytestream.fileno()).st_size:
+                self._mmap = mmap.mmap(self.bytestream.fileno(), 0, access=mmap.ACCESS_READ)
+                self.buffer = memoryview(self._mmap)
+            else:
+                self.buffer = memoryview(b'')
+        return self
+
+    def __exit__(self, exc_type, exc_val, traceback):
+        if self.bytestream is None:
+            return
+        # If views into the map are still alive (e.g. held by a traceback),
+        # leave the map to be closed when they are collected
+        try:
+            self.buffer.release()
+            if self._mmap is not None:
+                self._mmap.close()
+        except BufferError:
+            pass
+        self.buffer = None
+        self._mmap = None
+        self.bytestream.close()
+        self.bytestream = None
+
+    def rw_obj(self, obj, *args, **kwargs):
+        if not args and not kwargs:
+            record = get_compiled_record(type(obj), obj.context.endianness)
+            if record is not None:
+                record.read(self, obj)
+                return obj
+        return super().rw_obj(obj, *args, **kwargs)
+
+    def unpack_struct(self, compiled):
+        values = compiled.unpack_from(self.buffer, self.cursor)
+        self.cursor += compiled.size
+        return values
+
+    def _read(self, count):
+        start = self.cursor
+        if count == -1:
+            self.cursor = len(self.buffer)
+        else:
+            self.cursor = min(start + count, len(self.buffer))
+        return self.buffer[start:self.cursor]
+
     def _handle_pads(self, count):
-        value = self.bytestream.read(count)
+        value = self._read(count)
         if value != b'\x00'*count:
-            raise ValueError(f"Excepted padding bytes, but found {value}")
+            raise ValueError(f"Excepted padding bytes, but found {bytes(value)}")
 
     def _rw_single(self, typecode, size, value, endianness=None):
         if endianness is None:
             endianness = self.context.endianness
-        return struct.unpack(endianness + typecode, self.bytestream.read(size))[0]
+        value = get_struct(endianness, typecode).unpack_from(self.buffer, self.cursor)[0]
+        self.cursor += size
+        return value
 
     def _rw_multiple(self, typecode, size, value, shape, endianness=None):
         if endianness is None:
@@ -251,12 +389,29 @@ class Reader(BinaryTargetBase):
         for elem in shape:
             n_to_read *= elem
 
-        if typecode == "e":
-            arr_typecode = "f"
+        if self.use_ndarrays:
+            dtype = _to_dtype(endianness, typecode)
+            data = np.frombuffer(self.buffer, dtype, n_to_read, self.cursor)
+            self.cursor += size * n_to_read
+            # Copy out of the buffer so the file can be unmapped
+            return data.astype(dtype.newbyteorder('=')).reshape(shape)
+
+        if n_to_read > BULK_THRESHOLD and typecode in _array_typecodes:
+            data = array.array(typecode)
+            nbytes = size * n_to_read
+            if self.cursor + nbytes > len(self.buffer):
+                raise struct.error(f"Expected {nbytes} bytes at offset {self.cursor}, but the buffer ends at {len(self.buffer)}")
+            data.frombytes(self.buffer[self.cursor:self.cursor + nbytes])
+            if _needs_byteswap(endianness):
+                data.byteswap()
         else:
-            arr_typecode = typecode
-        data = array.array(arr_typecode,
-                           struct.unpack(endianness + typecode * n_to_read, self.bytestream.read(size * n_to_read)))
+            if typecode == "e":
+                arr_typecode = "f"
+            else:
+                arr_typecode = typecode
+            data = array.array(arr_typecode,
+                               get_struct(endianness, typecode, n_to_read).unpack_from(self.buffer, self.cursor))
+        self.cursor += size * n_to_read
         # Group the lists up
         # Skip the outer index because we don't need it (we'll automatically
         # get an end result of that length) and create groups by iterating
@@ -266,29 +421,84 @@ class Reader(BinaryTargetBase):
         return data
 
     def rw_str(self, value, length, encoding='ascii'):
-        if length == -1:
-            return self.bytestream.read().decode(encoding)
-        else:
-            return self.bytestream.read(length).decode(encoding)
+        return str(self._read(length), encoding)
+
+    def _find(self, sub, start):
+        # Scan in doubling chunks: short strings only copy a few bytes, and
+        # long ones are still found in linear time
+        chunk_size = 64
+        end = len(self.buffer)
+        while start < end:
+            stop = min(start + chunk_size, end)
+            idx = bytes(self.buffer[start:stop + len(sub) - 1]).find(sub)
+            if idx != -1:
+                return start + idx
+            start = stop
+            chunk_size *= 2
+        return -1
 
     def rw_cstr(self, value, encoding='ascii', end_char=b"\x00"):
-        out = b""
-        val = self.bytestream.read(1)
-        while (val != end_char and val != b''):
-            out += val
-            val = self.bytestream.read(1)
-        return out.decode(encoding)
+        end = self._find(end_char, self.cursor)
+        if end == -1:
+            return str(self._read(-1), encoding)
+        out = self.buffer[self.cursor:end]
+        self.cursor = end + len(end_char)
+        return str(out, encoding)
+
+    def read_cstr_table(self, count, encoding='ascii', end_char=b"\x00"):
+        """
+        Reads 'count' consecutive C-strings in one pass. Returns the strings
+        and the offset of each from the start of the table.
+        """
+        start = self.cursor
+        end = len(self.buffer)
+        # Grow the window until it holds every terminator (or the whole buffer)
+        size = 64 * max(count, 1)
+        while True:
+            table = bytes(self.buffer[start:start + size])
+            if table.count(end_char) >= count or start + size >= end:
+                break
+            size *= 2
+        parts = table.split(end_char, count)[:count]
+
+        strings = []
+        offsets = []
+        offset = 0
+        for part in parts:
+            strings.append(part.decode(encoding))
+            offsets.append(offset)
+            offset += len(part) + len(end_char)
+        # Like rw_cstr, anything past the end of the buffer reads as empty
+        strings.extend('' for _ in range(count - len(parts)))
+        offsets.extend(min(offset, end - start) for _ in range(count - len(parts)))
+        self.cursor = min(start + offset, end)
+        return strings, offsets
 
     def rw_bytestring(self, value, count):
-        if count == -1:
-            return self.bytestream.read()
-        else:
-            return self.bytestream.read(count)
+        return bytes(self._read(count))
 
     def peek_bytestring(self, count):
-        val = self.bytestream.read(count)
-        self.bytestream.seek(-len(val), 1)
-        return val
+        return bytes(self.buffer[self.cursor:self.cursor + count])
+
+    def view_bytestring(self, count):
+        """
+        Returns the next 'count' bytes as a memoryview into the buffer
+        rather than a copy.
+        """
+        return self._read(count)
+
+    def subreader(self, count):
+        """
+        Returns a Reader over the next 'count' bytes, sharing this Reader's
+        buffer, and advances past them.
+        """
+        return Reader(None, self.view_bytestring(count), self.use_ndarrays)
+
+    def rw_subfile(self, obj, size):
+        rw = self.subreader(size)
+        if obj is not None:
+            rw.rw_obj(obj)
+        return obj
 
     def rw_obj_array(self, value, obj_constructor, shape, validator=None, *args, **kwargs):
         if not hasattr(shape, "__getitem__"):
@@ -297,6 +507,12 @@ class Reader(BinaryTargetBase):
         for elem in shape:
             n_to_read *= elem
 
+        # Arrays of fixed-layout records are read as columns in ndarray mode
+        if self.use_ndarrays and validator is None and not args and not kwargs:
+            record = get_compiled_record(obj_constructor, obj_constructor().context.endianness)
+            if record is not None:
+                return record.read_array(self, n_to_read).reshape(shape)
+
         data = [obj_constructor() for _ in range(n_to_read)]
         for d in data:
             if validator is not None:
@@ -307,30 +523,121 @@ class Reader(BinaryTargetBase):
             data = chunk_list(data, subshape)
         return data
 
+    def iter_objs(self, obj_constructor, *args, **kwargs):
+        """
+        Reads objects back-to-back until the end of the buffer, yielding each
+        one as soon as it has been read.
+        """
+        while self.cursor < len(self.buffer):
+            yield self.rw_obj(obj_constructor(), *args, **kwargs)
+
     def align(self, offset, alignment, padval=b'\x00'):
         n_to_read = (alignment - (offset % alignment)) % alignment
-        data = self.bytestream.read(n_to_read)
+        data = bytes(self._read(n_to_read))
         expected = padval * (len(data) // len(padval))
         assert data == expected, f"Unexpected padding: Expected {expected}, read {data}."
 
     def assert_at_eof(self):
-        if (self.bytestream.read(1) != b''):
+        if self.cursor < len(self.buffer):
             raise Exception("Not at end of file!")
 
     def mode(self):
         return "read"
 
+    def tell(self):
+        return self.cursor
+
+    def seek(self, offset, whence=0):
+        if whence == 0:
+            self.cursor = offset
+        elif whence == 1:
+            self.cursor += offset
+        elif whence == 2:
+            self.cursor = len(self.buffer) + offset
+        else:
+            raise ValueError(f"Invalid whence ({whence})")
+
 
 class Writer(BinaryTargetBase):
+    """
+    Packs into an in-memory buffer, which replaces the file in one go when
+    the context exits without an error. The buffer can be preallocated with
+    'size_hint' (e.g. from an OffsetTracker pass) and grows if it turns out
+    too small.
+    Nested data can be written by a sub-Writer straight into a slice of the
+    parent's buffer.
+    """
+    __slots__ = ("buffer", "cursor", "size")
+
     open_flags = "wb"
 
+    def __init__(self, filename, buffer=None, size_hint=0):
+        super().__init__(filename)
+        self.buffer = bytearray(size_hint) if buffer is None else buffer
+        self.cursor = 0
+        self.size = 0
+
+    def __enter__(self):
+        # Nothing is opened until the data has been packed, so a failed
+        # write leaves any existing file untouched
+        return self
+
+    def __exit__(self, exc_type, exc_val, traceback):
+        if self.filename is None or exc_type is not None:
+            return
+        # Write to a temporary file beside the target and move it into
+        # place, so the target is never left partially written, even if it
+        # is the file that the data being written was mapped from
+        directory, basename = os.path.split(os.path.abspath(self.filename))
+        temp_path = os.path.join(directory, f".{basename}.{os.urandom(4).hex()}.tmp")
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o666)
+        try:
+            with os.fdopen(fd, self.open_flags) as F, memoryview(self.buffer) as data:
+                F.write(data[:self.size])
+            if os.path.exists(self.filename):
+                os.chmod(temp_path, stat.S_IMODE(os.stat(self.filename).st_mode))
+            os.replace(temp_path, self.filename)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def getvalue(self):
+        return bytes(self.buffer[:self.size])
+
+    def _reserve(self, count):
+        start = self.cursor
+        end = start + count
+        if end > len(self.buffer):
+            if not isinstance(self.buffer, bytearray):
+                raise ValueError(f"Attempted to write to 0x{end:0x}, past the end of a buffer of size 0x{len(self.buffer):0x}.")
+            self.buffer.extend(bytes(max(end - len(self.buffer), len(self.buffer))))
+        self.cursor = end
+        if end > self.size:
+            self.size = end
+        return start
+
+    def _write(self, data):
+        start = self._reserve(len(data))
+        self.buffer[start:self.cursor] = data
+
+    def rw_obj(self, obj, *args, **kwargs):
+        if not args and not kwargs:
+            record = get_compiled_record(type(obj), obj.context.endianness)
+            if record is not None:
+                record.write(self, obj)
+                return obj
+        return super().rw_obj(obj, *args, **kwargs)
+
+    def pack_struct(self, compiled, values):
+        compiled.pack_into(self.buffer, self._reserve(compiled.size), *values)
+
     def _handle_pads(self, count):
-        self.bytestream.write(b'\x00'*count)
+        self._write(b'\x00'*count)
 
     def _rw_single(self, typecode, size, value, endianness=None):
         if endianness is None:
             endianness = self.context.endianness
-        self.bytestream.write(struct.pack(endianness + typecode, value))
+        get_struct(endianness, typecode).pack_into(self.buffer, self._reserve(size), value)
         return value
 
     def _rw_multiple(self, typecode, size, value, shape, endianness=None):
@@ -343,25 +650,39 @@ class Writer(BinaryTargetBase):
         for elem in shape:
             n_to_read *= elem
 
+        if np is not None and isinstance(value, np.ndarray):
+            if value.size != n_to_read:
+                raise ValueError(f"Expected to write an array of shape {shape}, but it had shape {value.shape}.")
+            self._write(value.astype(_to_dtype(endianness, typecode), copy=False).tobytes())
+            return value
+
         data = value  # Shouldn't need to deepcopy since flatten_list will copy
         for _ in range(len(shape) - 1):
             data = flatten_list(data)
-        self.bytestream.write(struct.pack(endianness + typecode * n_to_read, *data))
+        if n_to_read > BULK_THRESHOLD and typecode in _array_typecodes:
+            data = array.array(typecode, data)
+            if len(data) != n_to_read:
+                raise struct.error(f"Expected to write {n_to_read} values, but received {len(data)}")
+            if _needs_byteswap(endianness):
+                data.byteswap()
+            self._write(data.tobytes())
+        else:
+            get_struct(endianness, typecode, n_to_read).pack_into(self.buffer, self._reserve(size * n_to_read), *data)
         return value
 
     def rw_str(self, value, length, encoding='ascii'):
-        self.bytestream.write(value.encode(encoding))
+        self._write(value.encode(encoding))
         return value
 
     def rw_cstr(self, value, encoding='ascii', end_char=b'\x00'):
         out = value.encode(encoding) + end_char
-        self.bytestream.write(out)
+        self._write(out)
         return value
 
     def rw_bytestring(self, value, count):
         if len(value) != count:
             raise ValueError(f"Expected to write a bytestring of length {count}, but it was length {len(value)}.")
-        self.bytestream.write(value)
+        self._write(value)
         return value
 
     def rw_obj_array(self, value, obj_constructor, shape, validator=None, *args, **kwargs):
@@ -371,6 +692,15 @@ class Writer(BinaryTargetBase):
         for elem in shape:
             n_to_read *= elem
 
+        if np is not None and isinstance(value, np.ndarray):
+            if value.size != n_to_read:
+                raise ValueError(f"Expected to write an array of shape {shape}, but it had shape {value.shape}.")
+            record = get_compiled_record(obj_constructor, obj_constructor().context.endianness)
+            if record is None:
+                raise TypeError(f"{obj_constructor.__qualname__} does not have a fixed layout, so cannot be written from an ndarray.")
+            record.write_array(self, value)
+            return value
+
         data = value  # Shouldn't need to deepcopy since flatten_list will copy
         for _ in range(len(shape) - 1):
             data = flatten_list(data)
@@ -384,7 +714,17 @@ class Writer(BinaryTargetBase):
     def align(self, offset, alignment, padval=b'\x00'):
         n_to_read = (alignment - (offset % alignment)) % alignment
         data = padval * (n_to_read // len(padval))
-        self.bytestream.write(data)
+        self._write(data)
+
+    def rw_subfile(self, obj, size):
+        start = self._reserve(size)
+        with memoryview(self.buffer) as buffer, buffer[start:self.cursor] as view:
+            rw = Writer(None, view)
+            if obj is not None:
+                rw.rw_obj(obj)
+            if rw.size != size:
+                raise ValueError(f"Expected to write a subfile of length {size}, but it was length {rw.size}.")
+        return obj
 
     def assert_at_eof(self):
         pass
@@ -392,6 +732,19 @@ class Writer(BinaryTargetBase):
     def mode(self):
         return "write"
 
+    def tell(self):
+        return self.cursor
+
+    def seek(self, offset, whence=0):
+        if whence == 0:
+            self.cursor = offset
+        elif whence == 1:
+            self.cursor += offset
+        elif whence == 2:
+            self.cursor = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence ({whence})")
+
 
 class OffsetTracker(BinaryTargetBase):
     open_flags = None
@@ -416,6 +769,39 @@ class OffsetTracker(BinaryTargetBase):
     def adv_offset(self, adv):
         self.virtual_offset += adv
 
+    def rw_obj(self, obj, *args, **kwargs):
+        if not args and not kwargs:
+            record = get_compiled_record(type(obj), obj.context.endianness)
+            if record is not None:
+                self.adv_offset(record.size)
+                return obj
+        return super().rw_obj(obj, *args, **kwargs)
+
+    def rw_obj_array(self, value, obj_constructor, shape, validator=None, *args, **kwargs):
+        if not hasattr(shape, "__getitem__"):
+            shape = (shape,)
+        n_to_read = 1
+        for elem in shape:
+            n_to_read *= elem
+
+        if np is not None and isinstance(value, np.ndarray):
+            record = get_compiled_record(obj_constructor, obj_constructor().context.endianness)
+            if record is None:
+                raise TypeError(f"{obj_constructor.__qualname__} does not have a fixed layout, so cannot be written from an ndarray.")
+            self.adv_offset(record.size * n_to_read)
+            return value
+
+        data = value
+        for _ in range(len(shape) - 1):
+            data = flatten_list(data)
+        for d in data:
+            self.rw_obj(d, *args, **kwargs)
+        return value
+
+    def rw_subfile(self, obj, size):
+        self.adv_offset(size)
+        return obj
+
     def _handle_pads(self, count):
         self.adv_offset(count)
 
@@ -430,9 +816,7 @@ class OffsetTracker(BinaryTargetBase):
         for elem in shape:
             n_to_read *= elem
 
-        for i in range(n_to_read):
-            self.adv_offset(size)
-
+        self.adv_offset(size * n_to_read)
         return value
 
     def rw_str(self, value, length, encoding='ascii'):
@@ -94,4 +94,19 @@ class PointerIndexableArrayCStr(PointerIndexableArray):
         super().__init__(context)
         self.encoding = encoding
         
+    def read_write(self, rw, *args, **kwargs):
+        if rw.mode() != "read":
+            return super().read_write(rw, *args, **kwargs)
+
+        # Decode the whole string table in one pass
+        start = rw.local_tell()
+        strings, offsets = rw.read_cstr_table(len(self.data), encoding=self.encoding)
+        for i, offset in enumerate(offsets):
+            curpos = start + offset
+            if i in self.idx_to_ptr:
+                rw.assert_local_file_pointer_now_at("Start of Array Entry", self.idx_to_ptr[i], curpos)
+            self.ptr_to_idx[curpos] = i
+            self.idx_to_ptr[i] = curpos
+        self.data = strings
+        
     def rw_element(self, rw, idx): self.data[idx] = rw.rw_cstr(self.data[idx], encoding=self.encoding)
@@ -0,0 +1,174 @@
+import os
+import sys
+import time
+
+from .BinaryTargets import Reader, Writer, OffsetTracker
+
+
+# Set DARKCLOUD_PROFILE to print a profile after every top-level
+# Serializable.read, and DARKCLOUD_PROFILE_STACKS to a filepath to also
+# append the collapsed stacks of each profile to it
+profile_reads = bool(os.environ.get("DARKCLOUD_PROFILE"))
+profile_stacks_path = os.environ.get("DARKCLOUD_PROFILE_STACKS") or None
+
+
+class Profiler:
+    """
+    Records how often each Serializable is operated on, how long it takes
+    and how many bytes it spans, both per class and per nesting path. While
+    a Profiler is active, 'rw_obj' and 'rw_obj_array' of every BinaryTarget
+    are wrapped to do the accounting; otherwise they are left untouched, so
+    profiling costs nothing when it is not in use.
+    Arrays appear in paths as 'ClassName[]', with their elements nested
+    below them. Arrays of fixed-layout records are read and written in one
+    go, so their elements do not appear separately.
+    Subfiles decoded in worker processes are not recorded, and lazily-loaded
+    ones only if they are decoded while the Profiler is active.
+
+    Usage:
+        with Profiler() as profiler:
+            binary.read(filepath)
+        print(profiler.report())
+    """
+    active = None
+    target_classes = (Reader, Writer, OffsetTracker)
+    hooked_methods = ("rw_obj", "rw_obj_array")
+
+    def __init__(self, modes=None):
+        self.modes = modes
+        # path -> [calls, total time, self time, bytes, self bytes]
+        self.paths = {}
+        # class name -> [calls, total time, self time, bytes, self bytes]
+        self.classes = {}
+        self._stack = []
+        self._class_depths = {}
+        self._originals = []
+
+    def __enter__(self):
+        if Profiler.active is not None:
+            raise RuntimeError("Another Profiler is already active")
+        Profiler.active = self
+        for cls in self.target_classes:
+            for name in self.hooked_methods:
+                original = cls.__dict__.get(name)
+                if original is not None:
+                    self._originals.append((cls, name, original))
+                    setattr(cls, name, getattr(self, f"_wrap_{name}")(original))
+        return self
+
+    def __exit__(self, exc_type, exc_val, traceback):
+        for cls, name, original in reversed(self._originals):
+            setattr(cls, name, original)
+        self._originals = []
+        self._stack = []
+        self._class_depths = {}
+        Profiler.active = None
+
+    def _wrap_rw_obj(self, original):
+        def rw_obj(rw, obj, *args, **kwargs):
+            return self._record(rw, type(obj).__qualname__, original, (rw, obj) + args, kwargs)
+        return rw_obj
+
+    def _wrap_rw_obj_array(self, original):
+        def rw_obj_array(rw, value, obj_constructor, *args, **kwargs):
+            name = getattr(obj_constructor, "__qualname__", type(obj_constructor).__qualname__) + "[]"
+            return self._record(rw, name, original, (rw, value, obj_constructor) + args, kwargs)
+        return rw_obj_array
+
+    def _record(self, rw, name, original, args, kwargs):
+        mode = rw.mode()
+        if self.modes is not None and mode not in self.modes:
+            return original(*args, **kwargs)
+
+        parent = self._stack[-1] if self._stack else None
+        path = (parent[0] if parent is not None else (mode,)) + (name,)
+        # [path, child time, child bytes]
+        frame = [path, 0., 0]
+        self._stack.append(frame)
+        self._class_depths[name] = self._class_depths.get(name, 0) + 1
+        start_pos = rw.tell()
+        start = time.perf_counter()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            nbytes = max(rw.tell() - start_pos, 0)
+            self._stack.pop()
+            depth = self._class_depths[name] - 1
+            self._class_depths[name] = depth
+            if parent is not None:
+                parent[1] += elapsed
+                parent[2] += nbytes
+            self_time = elapsed - frame[1]
+            self_bytes = max(nbytes - frame[2], 0)
+
+            stats = self.paths.get(path)
+            if stats is None:
+                stats = self.paths[path] = [0, 0., 0., 0, 0]
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] += self_time
+            stats[3] += nbytes
+            stats[4] += self_bytes
+
+            stats = self.classes.get(name)
+            if stats is None:
+                stats = self.classes[name] = [0, 0., 0., 0, 0]
+            stats[0] += 1
+            stats[2] += self_time
+            stats[4] += self_bytes
+            # Only count the outermost call of a recursive class in its
+            # totals, so nested calls are not counted twice
+            if depth == 0:
+                stats[1] += elapsed
+                stats[3] += nbytes
+
+    def report(self, sort="self_time", limit=None):
+        """
+        Returns a table of the per-class statistics, sorted by one of
+        'calls', 'total_time', 'self_time', 'bytes' or 'self_bytes'.
+        """
+        columns = ("calls", "total_time", "self_time", "bytes", "self_bytes")
+        key = columns.index(sort)
+        rows = sorted(self.classes.items(), key=lambda item: item[1][key], reverse=True)
+        if limit is not None:
+            rows = rows[:limit]
+
+        lines = [f"{'calls':>10} {'total s':>10} {'self s':>10} {'bytes':>12} {'self bytes':>12} {'MB/s':>9}  class"]
+        for name, (calls, total_time, self_time, nbytes, self_bytes) in rows:
+            throughput = f"{nbytes / 1024**2 / total_time:9.2f}" if total_time else f"{'-':>9}"
+            lines.append(f"{calls:>10} {total_time:>10.4f} {self_time:>10.4f} {nbytes:>12} {self_bytes:>12} {throughput}  {name}")
+        return "\n".join(lines)
+
+    def collapsed_stacks(self, weight="time"):
+        """
+        Returns the profile in the collapsed stack format read by
+        flamegraph.pl, speedscope and similar tools: one line per nesting
+        path, with frames joined by ';' and weighted by the path's self time
+        in microseconds, or by its self bytes if 'weight' is "bytes".
+        """
+        if weight == "time":
+            index, scale = 2, 1e6
+        elif weight == "bytes":
+            index, scale = 4, 1
+        else:
+            raise ValueError(f"Unknown weight '{weight}'")
+        lines = []
+        for path, stats in self.paths.items():
+            value = int(round(stats[index] * scale))
+            if value:
+                lines.append(f"{';'.join(path)} {value}")
+        return "\n".join(lines)
+
+    def write_collapsed_stacks(self, filepath, weight="time", append=False):
+        with open(filepath, 'a' if append else 'w') as F:
+            stacks = self.collapsed_stacks(weight)
+            if stacks:
+                F.write(stacks + "\n")
+
+    def print_summary(self, title=None, stream=sys.stderr):
+        if title is not None:
+            print(title, file=stream)
+        print(self.report(), file=stream)
+        if profile_stacks_path is not None:
+            self.write_collapsed_stacks(profile_stacks_path, append=True)
@@ -0,0 +1,304 @@
+import struct
+
+try:
+    import numpy as np
+except ImportError:  # Only needed for the columnar mode
+    np = None
+
+from .BinaryTargets import BinaryTargetBase, _to_dtype
+
+
+class DynamicLayout(Exception):
+    """Raised while tracing when a record's layout depends on its data."""
+
+
+class Traced:
+    """
+    Stands in for a value during a trace. Any attempt to inspect it (compare,
+    branch on, hash, or do arithmetic with it) means the record's layout
+    cannot be known without reading it, so the trace is abandoned.
+    """
+    __slots__ = ("index",)
+
+    def __init__(self, index):
+        self.index = index
+
+    def _inspected(self, *args):
+        raise DynamicLayout("Field value was inspected during the trace")
+
+    __eq__ = __ne__ = __lt__ = __le__ = __gt__ = __ge__ = _inspected
+    __bool__ = __hash__ = __index__ = __int__ = __float__ = _inspected
+
+
+class LayoutTracer(BinaryTargetBase):
+    """
+    Runs a read_write and records the sequence of fixed-size fields it
+    touches. Only scalars, fixed-length bytestrings, pads, and equality
+    checks are allowed; anything else ends the trace.
+    """
+    __slots__ = ("ops", "checks")
+
+    allowed = {"ops", "checks", "context", "type_sizes",
+               "rw_single", "rw_bytestring", "assert_equal", "assert_is_zero",
+               "rw_int8", "rw_uint8", "rw_int16", "rw_uint16", "rw_int32", "rw_uint32",
+               "rw_int64", "rw_uint64", "rw_float16", "rw_float32", "rw_float64",
+               "rw_pad8", "rw_pad16", "rw_pad32", "rw_pad64",
+               "rw_pad8s", "rw_pad16s", "rw_pad32s", "rw_pad64s"}
+
+    def __init__(self, context):
+        super().__init__(None)
+        self.context = context
+        self.ops = []
+        self.checks = []
+
+    def __getattribute__(self, name):
+        if name[0] != '_' and name not in LayoutTracer.allowed:
+            raise DynamicLayout(f"'{name}' is not supported in a fixed layout")
+        return object.__getattribute__(self, name)
+
+    def _add_op(self, typecode, count, endianness, value):
+        self.ops.append((typecode, count, endianness, value))
+        return Traced(len(self.ops) - 1)
+
+    def _handle_pads(self, count):
+        if type(count) is not int:
+            raise DynamicLayout("Pad count is not fixed")
+        self._add_op('x', count, None, None)
+
+    def _rw_single(self, typecode, size, value, endianness=None):
+        if endianness is None:
+            endianness = self.context.endianness
+        return self._add_op(typecode, 1, endianness, value)
+
+    def rw_bytestring(self, value, count):
+        if type(count) is not int:
+            raise DynamicLayout("Bytestring length is not fixed")
+        return self._add_op('s', count, None, value)
+
+    def assert_equal(self, data, check_value, formatter=lambda x: x):
+        if type(check_value) is Traced:
+            raise DynamicLayout("Field compared against another field")
+        if type(data) is Traced:
+            self.checks.append((data.index, check_value, formatter))
+        else:
+            BinaryTargetBase.assert_equal(data, check_value, formatter)
+
+    def assert_is_zero(self, data):
+        self.assert_equal(data, 0)
+
+
+class CompiledRecord:
+    """
+    A single-struct reader and packer for a Serializable whose read_write
+    always touches the same fixed sequence of fields.
+    """
+    __slots__ = ("size", "endianness", "ops", "read_struct", "write_struct", "assignments", "write_assignments",
+                 "sources", "bytestrings", "pads", "checks", "_dtype")
+
+    def __init__(self, ops, checks, assignments):
+        endiannesses = {op[2] for op in ops if op[2] is not None}
+        endianness = endiannesses.pop() if endiannesses else '<'
+        self.endianness = endianness
+        self.ops = ops
+        self._dtype = None
+
+        read_fmt = []
+        write_fmt = []
+        self.sources = []
+        self.bytestrings = []
+        self.pads = []
+        for i, (typecode, count, _, value) in enumerate(ops):
+            if typecode == 'x':
+                read_fmt.append(f"{count}s")
+                write_fmt.append(f"{count}x")
+                self.pads.append((i, count))
+                continue
+            if typecode == 's':
+                read_fmt.append(f"{count}s")
+                write_fmt.append(f"{count}s")
+                self.bytestrings.append((i, count))
+            else:
+                read_fmt.append(typecode)
+                write_fmt.append(typecode)
+            self.sources.append(value)
+
+        self.read_struct = struct.Struct(endianness + "".join(read_fmt))
+        self.write_struct = struct.Struct(endianness + "".join(write_fmt))
+        self.size = self.read_struct.size
+        self.checks = tuple(checks)
+
+        # Pads are read but not written, so map op indices to packed indices
+        written = [i for i, op in enumerate(ops) if op[0] != 'x']
+        self.assignments = tuple(assignments)
+        self.write_assignments = tuple((name, written.index(i)) for name, i in assignments
+                                       if self.sources[written.index(i)] != (name,))
+
+    def read(self, rw, obj):
+        values = rw.unpack_struct(self.read_struct)
+        for i, count in self.pads:
+            if values[i] != b'\x00'*count:
+                raise ValueError(f"Excepted padding bytes, but found {values[i]}")
+        for i, check_value, formatter in self.checks:
+            rw.assert_equal(values[i], check_value, formatter)
+        attrs = obj.__dict__
+        for name, i in self.assignments:
+            attrs[name] = values[i]
+
+    def write(self, rw, obj):
+        values = [getattr(obj, source[0]) if type(source) is tuple else source for source in self.sources]
+        all_values = self._with_pads(values)
+        for i, count in self.bytestrings:
+            if len(all_values[i]) != count:
+                raise ValueError(f"Expected to write a bytestring of length {count}, but it was length {len(all_values[i])}.")
+        for i, check_value, formatter in self.checks:
+            rw.assert_equal(all_values[i], check_value, formatter)
+        rw.pack_struct(self.write_struct, values)
+        attrs = obj.__dict__
+        for name, i in self.write_assignments:
+            attrs[name] = values[i]
+
+    ##################
+    # Columnar Modes #
+    ##################
+
+    def dtype(self):
+        """
+        Returns a NumPy structured dtype matching the record. Fields are named
+        after the attribute they are stored in; unstored fields and pads are
+        given private names.
+        """
+        if self._dtype is None:
+            names = {i: name for name, i in reversed(self.assignments)}
+            fields = {"names": [], "formats": [], "offsets": [], "itemsize": self.size}
+            offset = 0
+            for i, (typecode, count, _, _) in enumerate(self.ops):
+                if typecode == 'x':
+                    name = f"_pad_{i}"
+                else:
+                    name = names.get(i, f"_field_{i}")
+                if typecode in "xs":
+                    fmt = np.dtype(f"S{count}")
+                else:
+                    fmt = _to_dtype(self.endianness, typecode)
+                fields["names"].append(name)
+                fields["formats"].append(fmt)
+                fields["offsets"].append(offset)
+                offset += fmt.itemsize
+            self._dtype = np.dtype(fields)
+        return self._dtype
+
+    def read_array(self, rw, count):
+        """
+        Reads 'count' consecutive records into a NumPy record array, with one
+        column per field.
+        """
+        nbytes = self.size * count
+        data = rw.view_bytestring(nbytes)
+        if len(data) != nbytes:
+            raise struct.error(f"Expected {nbytes} bytes for {count} records, but only {len(data)} remain")
+        dtype = self.dtype()
+        records = np.frombuffer(data, dtype).astype(dtype.newbyteorder('='))
+        for i, _ in self.pads:
+            self._check_column(rw, records[dtype.names[i]], b'', lambda x: x)
+        for i, check_value, formatter in self.checks:
+            self._check_column(rw, records[dtype.names[i]], check_value, formatter)
+        return records.view(np.recarray)
+
+    def write_array(self, rw, records):
+        """
+        Packs a record array back into binary. Columns are matched to fields
+        by name; fields without a column are written as zero.
+        """
+        dtype = self.dtype()
+        records = records.reshape(-1)
+        out = np.zeros(len(records), dtype)
+        source_names = records.dtype.names or ()
+        sources = iter(self.sources)
+        for i, (typecode, count, _, _) in enumerate(self.ops):
+            if typecode == 'x':
+                continue
+            source = next(sources)
+            name = dtype.names[i]
+            if type(source) is tuple:
+                if source[0] in source_names:
+                    out[name] = records[source[0]]
+                elif name in source_names:
+                    out[name] = records[name]
+            elif source is not None:
+                out[name] = source
+        for i, check_value, formatter in self.checks:
+            self._check_column(rw, out[dtype.names[i]], check_value, formatter)
+        rw.rw_bytestring(out.tobytes(), self.size * len(out))
+
+    @staticmethod
+    def _check_column(rw, column, check_value, formatter):
+        mismatches = column != check_value
+        if mismatches.any():
+            rw.assert_equal(column[mismatches.argmax()].item(), check_value, formatter)
+
+    def _with_pads(self, values):
+        if not self.pads:
+            return values
+        values = list(values)
+        for i, _ in self.pads:
+            values.insert(i, None)
+        return values
+
+
+def compile_record(cls, endianness):
+    """
+    Traces 'cls.read_write' on a fresh instance to discover whether it has a
+    fixed layout. Returns a CompiledRecord if so, otherwise None.
+    """
+    try:
+        obj = cls()
+        attrs = vars(obj)
+    except Exception:
+        return None
+    obj.context.endianness = endianness
+
+    # Replace every existing attribute with a placeholder, so that branching
+    # on the object's prior state is caught as well
+    inputs = {}
+    for name in list(attrs):
+        if name == "context":
+            continue
+        placeholder = Traced(None)
+        inputs[id(placeholder)] = name
+        attrs[name] = placeholder
+
+    tracer = LayoutTracer(obj.context)
+    try:
+        obj.read_write(tracer)
+    except Exception:
+        return None
+
+    ops = tracer.ops
+    if len({op[2] for op in ops if op[2] is not None}) > 1:
+        return None
+
+    # Resolve where the Writer would take each field's value from
+    for i, op in enumerate(ops):
+        value = op[3]
+        if op[0] == 'x':
+            continue
+        if type(value) is Traced:
+            if value.index is not None or id(value) not in inputs:
+                return None
+            ops[i] = (*op[:3], (inputs[id(value)],))
+        elif isinstance(value, (list, tuple, dict, set)):
+            return None
+
+    assignments = []
+    for name, value in attrs.items():
+        if name == "context":
+            continue
+        if type(value) is not Traced:
+            return None
+        if value.index is None:
+            if inputs.get(id(value)) != name:
+                return None
+            continue
+        assignments.append((name, value.index))
+
+    return CompiledRecord(ops, tracer.checks, assignments)
@@ -1,6 +1,7 @@
 import copy
 
-from .BinaryTargets import Reader, Writer, PointerCalculator, Context
+from .BinaryTargets import Reader, Writer, OffsetTracker, PointerCalculator, Context
+from . import Profiler as profiling
 
 
 class Serializable:
@@ -19,13 +20,27 @@ class Serializable:
         else:
             self.context = copy.deepcopy(context)
 
-    def read(self, filepath):
-        with Reader(filepath) as rw:
+    def read(self, filepath, use_ndarrays=False):
+        if profiling.profile_reads and profiling.Profiler.active is None:
+            with profiling.Profiler() as profiler:
+                self.__read(filepath, use_ndarrays)
+            profiler.print_summary(f"Profile of reading {filepath}:")
+        else:
+            self.__read(filepath, use_ndarrays)
+
+    def __read(self, filepath, use_ndarrays):
+        with Reader(filepath, use_ndarrays=use_ndarrays) as rw:
             rw.rw_obj(self)
 
     def write(self, filepath):
-        with Writer(filepath) as rw:
+        # Size the output up-front so it is packed into a single buffer
+        with Writer(filepath, size_hint=self.calc_size()) as rw:
+            rw.rw_obj(self)
+
+    def calc_size(self):
+        with OffsetTracker() as rw:
             rw.rw_obj(self)
+            return rw.tell()
 
     def calc_pointers(self):
         with PointerCalculator() as rw:
@@ -1,5 +1,12 @@
-import bpy
-from .BlenderIO.Import import ImportDC
+try:
+    import bpy
+except ImportError:
+    # Worker processes import this package outside of Blender, where only
+    # the bpy-free DarkCloudModelTools subpackage is used
+    bpy = None
+
+if bpy is not None:
+    from .BlenderIO.Import import ImportDC, pack_pending_images
 
 
 bl_info = {
@@ -14,13 +21,14 @@ bl_info = {
         }
 
 
-class DCImportSubmenu(bpy.types.Menu):
-    bl_idname = "OBJECT_MT_DarkCloud_import_submenu"
-    bl_label = "Dark Cloud"
+if bpy is not None:
+    class DCImportSubmenu(bpy.types.Menu):
+        bl_idname = "OBJECT_MT_DarkCloud_import_submenu"
+        bl_label = "Dark Cloud"
 
-    def draw(self, context):
-        layout = self.layout
-        layout.operator(ImportDC.bl_idname, text="Dark Cloud Model (.chr)")
+        def draw(self, context):
+            layout = self.layout
+            layout.operator(ImportDC.bl_idname, text="Dark Cloud Model (.chr)")
 
 
 def menu_func_import(self, context):
@@ -32,12 +40,14 @@ def register():
     bpy.utils.register_class(ImportDC)
     bpy.utils.register_class(DCImportSubmenu)
     bpy.types.TOPBAR_MT_file_import.append(menu_func_import)
+    bpy.app.handlers.save_pre.append(pack_pending_images)
 
 
 def unregister():
     bpy.utils.unregister_class(ImportDC)
     bpy.utils.unregister_class(DCImportSubmenu)
     bpy.types.TOPBAR_MT_file_import.remove(menu_func_import)
+    bpy.app.handlers.save_pre.remove(pack_pending_images)
 
 # if __name__ == "__main__":
 #     register()
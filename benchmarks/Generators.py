@@ -0,0 +1,334 @@
+"""
+Procedural generators for every file type in a CHR archive. The output is
+random but structurally valid: every count, size and offset is consistent,
+so it parses with the same code paths as the game's files. Everything is
+packed through the regular Writer.
+"""
+import numpy as np
+
+from DarkCloudModelTools.filetypes.CHR.CHRBinary import CHRBinary
+from DarkCloudModelTools.filetypes.MDS.MDSBinary import MDSBinary, Bone, MDT, Strip, MaterialBinary
+from DarkCloudModelTools.filetypes.WGT.WGTBinary import WGTBinary
+from DarkCloudModelTools.filetypes.MOT.MOTBinary import MOTBinary
+from DarkCloudModelTools.filetypes.BBP.BBPBinary import BBPBinary
+from DarkCloudModelTools.filetypes.TXT.TXTBinary import TextBinary
+from DarkCloudModelTools.filetypes.IMG.IMGBinary import IMGBinary, ImageRecord, TIM2
+from DarkCloudModelTools.serialisation.BinaryTargets import Writer
+
+
+# name -> (image_colour_type, bits per pixel, CLUT colour count)
+texture_formats = {
+    "4bit":  (4, 4, 16),
+    "8bit":  (5, 8, 256),
+    "32bit": (3, 32, 0),
+}
+
+
+def to_bytes(obj):
+    with Writer(None, size_hint=obj.calc_size()) as rw:
+        rw.rw_obj(obj)
+        return rw.getvalue()
+
+
+def random_rotations(rng, count):
+    """
+    Returns (N, 3, 3) random rotation matrices.
+    """
+    q, r = np.linalg.qr(rng.standard_normal((count, 3, 3)))
+    q *= np.sign(np.diagonal(r, axis1=1, axis2=2))[:, None, :]
+    q[np.linalg.det(q) < 0, :, 0] *= -1
+    return q
+
+
+def generate_mdt(rng, vertex_count, strip_count, strip_length, material_count=2):
+    mdt = MDT()
+
+    positions = np.ones((vertex_count, 4), np.float32)
+    positions[:, :3] = rng.uniform(-1, 1, (vertex_count, 3))
+    normals = np.zeros((vertex_count, 4), np.float32)
+    normals[:, :3] = rng.standard_normal((vertex_count, 3))
+    normals[:, :3] /= np.linalg.norm(normals[:, :3], axis=1, keepdims=True)
+    uvs = np.zeros((vertex_count, 4), np.float32)
+    uvs[:, :2] = rng.random((vertex_count, 2))
+    mdt.positions = positions.tolist()
+    mdt.normals   = normals.tolist()
+    mdt.UVs       = uvs.tolist()
+
+    # A mix of triangle strips (type 4) and triangle lists (type 3), with
+    # the position, normal and UV of each vertex sharing an index
+    mdt.faces.unknown_0x00 = 0
+    mdt.faces.unknown_0x04 = 0
+    mdt.faces.unknown_0x0C = 0
+    mdt.faces.strips = []
+    for _ in range(strip_count):
+        strip = Strip()
+        strip.type = 3 if rng.random() < 0.25 else 4
+        strip.is_wide_vertex = 0
+        if strip.type == 3:
+            strip.vertex_count = 3 * max(1, int(rng.integers(1, strip_length + 1)) // 3)
+        else:
+            strip.vertex_count = int(rng.integers(3, strip_length + 1))
+        strip.material_idx = int(rng.integers(material_count))
+        indices = rng.integers(vertex_count, size=strip.vertex_count)
+        strip.indices = np.repeat(indices[:, None], 3, axis=1).tolist()
+        mdt.faces.strips.append(strip)
+    mdt.faces.strip_count = len(mdt.faces.strips)
+
+    mdt.materials = []
+    for material_idx in range(material_count):
+        material = MaterialBinary()
+        values = rng.random(13).astype(np.float32).tolist()
+        for offset, value in zip(range(0x00, 0x34, 4), values):
+            setattr(material, f"unknown_0x{offset:02X}", 0. if 0x1C <= offset <= 0x2C else value)
+        material.texture_name = f"tex{material_idx}".encode('ascii').ljust(0x2C, b'\x00')
+        mdt.materials.append(material)
+
+    # Lay the sections out one after another, as the game's files do
+    contents = mdt.contents
+    contents.filetype = b"MDT\x00"
+    contents.unknown_0x04 = 0
+    contents.unknown_0x3C = b'\x00' * 4
+    offset = 0x40
+    contents.position_count   = vertex_count
+    contents.positions_offset = offset
+    offset += 0x10 * vertex_count
+    contents.faces_offset = offset
+    contents.face_count   = 0x10 + sum(0x0C + 0x0C*strip.vertex_count for strip in mdt.faces.strips)
+    offset += contents.face_count
+    mdt.faces_junk = b'\x00' * (-offset % 0x10)
+    offset += len(mdt.faces_junk)
+    contents.normal_count   = vertex_count
+    contents.normals_offset = offset
+    offset += 0x10 * vertex_count
+    contents.UV_count  = vertex_count
+    contents.UV_offset = offset
+    offset += 0x10 * vertex_count
+    contents.unknown_1_count  = 0
+    contents.unknown_1_offset = 0
+    contents.material_count   = material_count
+    contents.materials_offset = offset
+    offset += 0x60 * material_count
+    contents.size = offset
+    return mdt
+
+
+def generate_skeleton(rng, bone_count):
+    """
+    Returns random parent indices and (N, 16) row-major local matrices,
+    with every parent listed before its children.
+    """
+    parents = np.full(bone_count, -1, np.int64)
+    if bone_count > 1:
+        parents[1:] = (rng.random(bone_count - 1) * np.arange(1, bone_count)).astype(np.int64)
+    matrices = np.zeros((bone_count, 4, 4), np.float32)
+    matrices[:, :3, :3] = random_rotations(rng, bone_count)
+    matrices[:, 3, :3] = rng.uniform(-0.5, 0.5, (bone_count, 3))
+    matrices[:, 3, 3] = 1.
+    return parents, matrices.reshape(bone_count, 16)
+
+
+def generate_mds(rng, bone_count, mesh_count, vertex_count, strip_count, strip_length):
+    """
+    The first 'mesh_count' bones each own a mesh. Any other bones point at
+    the empty MDT that terminates the file.
+    """
+    mesh_count = min(mesh_count, bone_count)
+    mds = MDSBinary()
+    mds.contents.unknown_0x04 = 1
+    mds.contents.bone_count = bone_count
+    mds.contents.mdt_count = mesh_count
+
+    mdts = [generate_mdt(rng, vertex_count, strip_count, strip_length) for _ in range(mesh_count)]
+    mdt_offsets = []
+    offset = 0x10 + 0x70 * bone_count
+    for mdt in mdts:
+        mdt_offsets.append(offset)
+        offset += mdt.contents.size
+    if mesh_count < bone_count:
+        empty = MDT()
+        empty.contents.filetype = b''
+        mdts.append(empty)
+        mdt_offsets.extend([offset] * (bone_count - mesh_count))
+
+    parents, matrices = generate_skeleton(rng, bone_count)
+    for bone_idx in range(bone_count):
+        bone = Bone()
+        bone.index = bone_idx
+        bone.name = f"bone_{bone_idx}".encode('ascii').ljust(0x20, b'\x00')
+        bone.mdt_offset = mdt_offsets[bone_idx]
+        bone.parent = int(parents[bone_idx])
+        bone.matrix = matrices[bone_idx].tolist()
+        mds.bones.append(bone)
+    mds.mdts.data = mdts
+    return mds
+
+
+def generate_wgt(rng, bone_count, mesh_count, vertex_count, influences=2):
+    """
+    Skins every mesh, owned by the first 'mesh_count' bones, with
+    'influences' bones per vertex whose weights add up to 100.
+    """
+    wgt = WGTBinary()
+    influences = min(influences, bone_count)
+    for meshbone_idx in range(min(mesh_count, bone_count)):
+        bone_idxs = rng.choice(bone_count, influences, replace=False)
+        weights = rng.random((vertex_count, influences)).astype(np.float32) + 0.1
+        weights *= 100 / weights.sum(axis=1, keepdims=True)
+        for column, bone_idx in enumerate(bone_idxs.tolist()):
+            group = WGTBinary.VertexGroup()
+            group.meshbone_idx = meshbone_idx
+            group.bone_idx     = bone_idx
+            group.unknown_0x08 = 20
+            group.header_size  = 32
+            group.elem_count   = vertex_count
+            group.total_size   = 32 + 32*vertex_count
+            group.unknown_0x18 = 0
+            group.unknown_0x1C = 0
+            for vertex_idx, weight in enumerate(weights[:, column].tolist()):
+                element = WGTBinary.VertexGroup.Element()
+                element.index = vertex_idx
+                element.unknown_0x04 = 0
+                element.unknown_0x08 = 0
+                element.unknown_0x0C = 0
+                element.weight = weight
+                element.unknown_0x14 = 0
+                element.unknown_0x18 = 0
+                element.unknown_0x1C = 0
+                group.elements.append(element)
+            wgt.groups.append(group)
+    return wgt
+
+
+def generate_mot(rng, animation_count, frame_count):
+    mot = MOTBinary()
+    for animation_idx in range(animation_count):
+        animation = MOTBinary.Animation()
+        animation.unknown_0x00   = animation_idx
+        animation.unknown_0x04   = 0
+        animation.data_type      = int(rng.integers(3))
+        animation.header_size    = 32
+        animation.frame_count    = frame_count
+        animation.next_anim_jump = 32 + 32*frame_count
+        animation.unknown_0x18   = 0
+        animation.unknown_0x1C   = 0
+        values = rng.random((frame_count, 4)).astype(np.float32).tolist()
+        for frame_idx, (x, y, z, w) in enumerate(values):
+            frame = MOTBinary.Animation.Frame()
+            frame.unknown_0x00 = frame_idx
+            frame.unknown_0x04 = 0
+            frame.unknown_0x08 = 0
+            frame.unknown_0x0C = 0
+            frame.unknown_0x10 = x
+            frame.unknown_0x14 = y
+            frame.unknown_0x18 = z
+            frame.unknown_0x1C = w
+            animation.frames.append(frame)
+        mot.animations.append(animation)
+    return mot
+
+
+def generate_bbp(rng, bone_count):
+    bbp = BBPBinary()
+    bbp.bpms = rng.standard_normal((bone_count, 16)).astype(np.float32).tolist()
+    return bbp
+
+
+def generate_tim2(rng, width, height, texture_format="8bit", mipmap_count=1):
+    image_colour_type, bpp, clut_colour_count = texture_formats[texture_format]
+    tim2 = TIM2()
+    tim2.header.version   = 4
+    tim2.header.alignment = 0
+    tim2.header.tex_count = 1
+
+    image = TIM2.TIM2Image()
+    base_size = width * height * bpp // 8
+    image.texture = [rng.integers(256, size=base_size // 4**i, dtype=np.uint8).tobytes() for i in range(mipmap_count)]
+    # 32-bit CSM1 colours, so the palette unswizzling is exercised too
+    image.clut = rng.integers(256, size=4*clut_colour_count, dtype=np.uint8).tobytes()
+
+    header = image.header
+    header.header_size       = 0x30
+    header.image_size        = sum(len(level) for level in image.texture)
+    header.clut_size         = len(image.clut)
+    header.total_size        = header.header_size + header.image_size + header.clut_size
+    header.clut_colour_count = clut_colour_count
+    header.image_format      = 0
+    header.mipmap_count      = mipmap_count
+    header.clut_colour_type  = 3 if clut_colour_count else 0
+    header.image_colour_type = image_colour_type
+    header.image_width       = width
+    header.image_height      = height
+    header.gs_tex_reg_1      = 0
+    header.gs_tex_reg_2      = 0
+    header.gs_flags_reg      = 0
+    header.gs_clut_reg       = 0
+    header.user_data         = b''
+    tim2.images = [image]
+    return tim2
+
+
+def generate_img(rng, texture_count, width, height, texture_format="8bit", mipmap_count=1):
+    img = IMGBinary()
+    img.contents.count = texture_count
+    img.contents.unknown_0x08 = 0
+    img.contents.unknown_0x0C = 0
+    offset = 0x10 + 0x30 * texture_count
+    for texture_idx in range(texture_count):
+        tim2 = generate_tim2(rng, width, height, texture_format, mipmap_count)
+        record = ImageRecord()
+        record.filename = f"tex{texture_idx}".encode('ascii').ljust(0x20, b'\x00')
+        record.offset = offset
+        record.unknown_0x24 = 0
+        record.unknown_0x28 = 0
+        record.unknown_0x2C = 0
+        offset += tim2.calc_size()
+        img.image_records.append(record)
+        img.image_data.append(tim2)
+    return img
+
+
+def generate_cfg(prefix):
+    cfg = TextBinary()
+    cfg.text = (f'MODEL "{prefix}.mds"\n'
+                f'MOTION 0, "{prefix}.mot", "{prefix}.bbp", "{prefix}.wgt"\n'
+                f'IMG 0, "{prefix}.img"\n')
+    return cfg
+
+
+def generate_chr(seed=0, submodel_count=1, bone_count=64, mesh_count=8, vertex_count=500,
+                 strip_count=100, strip_length=12, influences=2, animation_count=64, frame_count=60,
+                 texture_count=4, texture_size=128, texture_format="8bit", mipmap_count=1):
+    """
+    Returns a CHRBinary holding 'submodel_count' models, each made of a
+    CFG, MDS, WGT, MOT, BBP and IMG file generated from 'seed'.
+    """
+    rng = np.random.default_rng(seed)
+    files = []
+    for submodel_idx in range(submodel_count):
+        prefix = f"model{submodel_idx}"
+        files.extend([
+            (f"{prefix}.cfg", generate_cfg(prefix)),
+            (f"{prefix}.mds", generate_mds(rng, bone_count, mesh_count, vertex_count, strip_count, strip_length)),
+            (f"{prefix}.wgt", generate_wgt(rng, bone_count, mesh_count, vertex_count, influences)),
+            (f"{prefix}.mot", generate_mot(rng, animation_count, frame_count)),
+            (f"{prefix}.bbp", generate_bbp(rng, bone_count)),
+            (f"{prefix}.img", generate_img(rng, texture_count, texture_size, texture_size, texture_format, mipmap_count)),
+        ])
+
+    chr_binary = CHRBinary()
+    for name, obj in files:
+        file = CHRBinary.File()
+        file.name_buffer = name.encode('ascii').ljust(0x40, b'\x00')
+        file.file_size = obj.calc_size()
+        file.next_file_jump = 0x50 + file.file_size + (-file.file_size % 0x10)
+        file.unknown_0x0C = 0
+        file.file = obj
+        chr_binary.files.append(file)
+
+    terminator = CHRBinary.File()
+    terminator.name_buffer = b'\x00' * 0x40
+    terminator.file_size = 0xFFFFFFFF
+    terminator.next_file_jump = 0xFFFFFFFF
+    terminator.unknown_0x0C = 0
+    chr_binary.files.append(terminator)
+    return chr_binary
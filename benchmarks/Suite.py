@@ -0,0 +1,253 @@
+import gc
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from DarkCloudModelTools.filetypes.BBP.BBPBinary import BBPBinary
+from DarkCloudModelTools.filetypes.CFG.CFGInterface import CFGInterface
+from DarkCloudModelTools.filetypes.CHR.CHRBinary import CHRBinary
+from DarkCloudModelTools.filetypes.CHR.Model import Model
+from DarkCloudModelTools.filetypes.IMG.IMGBinary import IMGBinary
+from DarkCloudModelTools.filetypes.IMG.ImageInterface import ImageInterface
+from DarkCloudModelTools.filetypes.MDS.MDSBinary import MDSBinary
+from DarkCloudModelTools.filetypes.MDS.MDSInterface import MDSInterface
+from DarkCloudModelTools.filetypes.MOT.MOTBinary import MOTBinary
+from DarkCloudModelTools.filetypes.TXT.TXTBinary import TextBinary
+from DarkCloudModelTools.filetypes.WGT.WGTBinary import WGTBinary
+from DarkCloudModelTools.serialisation.BinaryTargets import Reader
+from .Generators import generate_chr, to_bytes
+
+
+presets = {
+    "small":  dict(bone_count=16,  mesh_count=2,  vertex_count=200,  strip_count=40,  animation_count=16,  frame_count=30,  texture_count=2, texture_size=64),
+    "medium": dict(bone_count=64,  mesh_count=8,  vertex_count=500,  strip_count=100, animation_count=64,  frame_count=60,  texture_count=4, texture_size=128),
+    "large":  dict(bone_count=128, mesh_count=16, vertex_count=2000, strip_count=400, animation_count=128, frame_count=120, texture_count=8, texture_size=256),
+}
+
+
+class Case:
+    """
+    A single benchmark. 'setup' is called once and returns the function
+    to time, so preparing inputs is not measured. 'nbytes' and 'records'
+    are the amount of input that one call of that function processes.
+    """
+    def __init__(self, name, setup, nbytes, records, record_name):
+        self.name = name
+        self.setup = setup
+        self.nbytes = nbytes
+        self.records = records
+        self.record_name = record_name
+
+
+def parse(binary_type, data, use_ndarrays=False):
+    obj = binary_type()
+    Reader(None, data, use_ndarrays).rw_obj(obj)
+    return obj
+
+
+def build_cases(filepath, data):
+    """
+    Returns the Cases for the generated archive at 'filepath', whose raw
+    bytes are 'data'.
+    """
+    archive = CHRBinary(lazy=True)
+    archive.read(filepath)
+    payloads = {}
+    for name, (offset, size) in archive.table.items():
+        payloads.setdefault(name.rsplit('.', 1)[-1], []).append(bytes(data[offset:offset + size]))
+    def total_size(ext):
+        return sum(len(payload) for payload in payloads[ext])
+
+    mdss = [parse(MDSBinary, payload) for payload in payloads["mds"]]
+    wgts = [parse(WGTBinary, payload) for payload in payloads["wgt"]]
+    mots = [parse(MOTBinary, payload) for payload in payloads["mot"]]
+    bbps = [parse(BBPBinary, payload) for payload in payloads["bbp"]]
+    imgs = [parse(IMGBinary, payload) for payload in payloads["img"]]
+    cfgs = [parse(TextBinary, payload) for payload in payloads["cfg"]]
+    tm2s = [tim2.images[0] for img in imgs for tim2 in img.image_data]
+
+    vertex_count  = sum(mdt.contents.position_count for mds in mdss for mdt in mds.mdts if mdt.contents.filetype)
+    element_count = sum(group.elem_count for wgt in wgts for group in wgt.groups)
+    frame_count   = sum(animation.frame_count for mot in mots for animation in mot.animations)
+    matrix_count  = sum(len(bbp.bpms) for bbp in bbps)
+    pixel_count   = sum(tm2.header.image_width * tm2.header.image_height for tm2 in tm2s)
+    triangle_count = sum(mesh.face_count for mds in mdss for mesh in MDSInterface.from_binary(mds).meshes)
+
+    def parse_all(binary_type, ext, use_ndarrays=False):
+        def setup():
+            return lambda: [parse(binary_type, payload, use_ndarrays) for payload in payloads[ext]]
+        return setup
+
+    def chr_read(**kwargs):
+        def setup():
+            def run():
+                binary = CHRBinary(lazy=kwargs.get("lazy", False))
+                binary.read(filepath, kwargs.get("use_ndarrays", False))
+                return binary
+            return run
+        return setup
+
+    def chr_write():
+        binary = CHRBinary()
+        binary.read(filepath)
+        return lambda: to_bytes(binary)
+
+    def mds_convert():
+        binaries = [parse(MDSBinary, payload) for payload in payloads["mds"]]
+        return lambda: [MDSInterface.from_binary(mds) for mds in binaries]
+
+    def tm2_decode():
+        return lambda: [ImageInterface.from_TM2(tm2) for tm2 in tm2s]
+
+    def cfg_convert():
+        return lambda: [CFGInterface.from_binary(cfg) for cfg in cfgs]
+
+    def model_load():
+        return lambda: Model.from_file(filepath, use_ndarrays=True, decode_textures=True)
+
+    file_count = len(archive.files)
+    return [
+        Case("parse/chr",          chr_read(),                                 len(data), file_count, "files"),
+        Case("parse/chr-ndarrays", chr_read(use_ndarrays=True),                len(data), file_count, "files"),
+        Case("parse/chr-lazy",     chr_read(lazy=True),                        len(data), file_count, "files"),
+        Case("parse/mds",          parse_all(MDSBinary, "mds"),                total_size("mds"), vertex_count,  "vertices"),
+        Case("parse/mds-ndarrays", parse_all(MDSBinary, "mds", True),          total_size("mds"), vertex_count,  "vertices"),
+        Case("parse/wgt",          parse_all(WGTBinary, "wgt"),                total_size("wgt"), element_count, "weights"),
+        Case("parse/wgt-ndarrays", parse_all(WGTBinary, "wgt", True),          total_size("wgt"), element_count, "weights"),
+        Case("parse/mot",          parse_all(MOTBinary, "mot"),                total_size("mot"), frame_count,   "frames"),
+        Case("parse/mot-ndarrays", parse_all(MOTBinary, "mot", True),          total_size("mot"), frame_count,   "frames"),
+        Case("parse/bbp",          parse_all(BBPBinary, "bbp"),                total_size("bbp"), matrix_count,  "matrices"),
+        Case("parse/img",          parse_all(IMGBinary, "img"),                total_size("img"), len(tm2s),     "textures"),
+        Case("parse/cfg",          parse_all(TextBinary, "cfg"),               total_size("cfg"), len(cfgs),     "files"),
+        Case("convert/mds",        mds_convert,                                total_size("mds"), triangle_count, "triangles"),
+        Case("convert/tm2",        tm2_decode,                                 total_size("img"), pixel_count,   "pixels"),
+        Case("convert/cfg",        cfg_convert,                                total_size("cfg"), len(cfgs),     "files"),
+        Case("convert/model",      model_load,                                 len(data), len(payloads["cfg"]), "models"),
+        Case("write/chr",          chr_write,                                  len(data), file_count, "files"),
+    ]
+
+
+def measure(case, repeat, trace_memory=True):
+    """
+    Times 'repeat' calls of the case after one warm-up call, and measures
+    the peak memory allocated by Python and NumPy during one more call.
+    """
+    func = case.setup()
+    func()
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    peak = None
+    if trace_memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    best = min(times)
+    return {
+        "best_seconds":   best,
+        "median_seconds": statistics.median(times),
+        "mb_per_s":       case.nbytes / 1024**2 / best if best else None,
+        "records_per_s":  case.records / best if best else None,
+        "record_name":    case.record_name,
+        "bytes":          case.nbytes,
+        "records":        case.records,
+        "peak_bytes":     peak
+    }
+
+
+def run(parameters, repeat=5, name_filter=None, trace_memory=True, report=print):
+    """
+    Generates an archive from 'parameters' (keyword arguments of
+    'generate_chr'), runs every case whose name contains 'name_filter',
+    and returns the results keyed by case name.
+    """
+    data = to_bytes(generate_chr(**parameters))
+    fd, filepath = tempfile.mkstemp(suffix=".chr")
+    try:
+        with os.fdopen(fd, 'wb') as F:
+            F.write(data)
+        report(f"Generated a {len(data) / 1024**2:.2f} MB archive")
+        results = {}
+        for case in build_cases(filepath, data):
+            if name_filter is not None and name_filter not in case.name:
+                continue
+            results[case.name] = measure(case, repeat, trace_memory)
+            report(format_result(case.name, results[case.name]))
+        return results
+    finally:
+        os.remove(filepath)
+
+
+def environment():
+    return {
+        "python":   platform.python_version(),
+        "numpy":    np.__version__,
+        "platform": platform.platform(),
+        "machine":  platform.machine(),
+        "cpus":     os.cpu_count()
+    }
+
+
+def save_baseline(filepath, parameters, results):
+    with open(filepath, 'w') as F:
+        json.dump({"environment": environment(), "parameters": parameters, "results": results}, F, indent=2)
+
+
+def load_baseline(filepath):
+    with open(filepath, 'r') as F:
+        return json.load(F)
+
+
+def format_result(name, result):
+    # Throughputs are None when a case ran too fast for the timer to resolve
+    mb_per_s = f"{'-':>9}" if result["mb_per_s"] is None else f"{result['mb_per_s']:9.2f}"
+    records_per_s = f"{'-':>14}" if result["records_per_s"] is None else f"{result['records_per_s']:14,.0f}"
+    peak = "" if result["peak_bytes"] is None else f"{result['peak_bytes'] / 1024**2:9.2f} MB peak"
+    return (f"{name:<20} {result['best_seconds'] * 1000:10.3f} ms  {mb_per_s} MB/s  "
+            f"{records_per_s} {result['record_name'] + '/s':<12}  {peak}")
+
+
+def compare(baseline, parameters, results, threshold=0.1, report=print):
+    """
+    Reports the change of each result against 'baseline', and returns the
+    names of the cases that got more than 'threshold' slower, or whose
+    peak memory grew by more than 'threshold'.
+    """
+    if baseline["parameters"] != parameters:
+        report("Warning: the baseline was generated with different parameters")
+    if baseline["environment"] != environment():
+        report("Warning: the baseline was recorded in a different environment")
+
+    regressions = []
+    for name, result in results.items():
+        old = baseline["results"].get(name)
+        if old is None:
+            report(f"{name:<20} (not in baseline)")
+            continue
+        time_change = result["best_seconds"] / old["best_seconds"] - 1
+        line = f"{name:<20} time {time_change:+8.1%}"
+        regressed = time_change > threshold
+        if result["peak_bytes"] is not None and old["peak_bytes"]:
+            memory_change = result["peak_bytes"] / old["peak_bytes"] - 1
+            line += f"  peak memory {memory_change:+8.1%}"
+            regressed |= memory_change > threshold
+        if regressed:
+            regressions.append(name)
+            line += "  REGRESSION"
+        report(line)
+    return regressions
@@ -0,0 +1,73 @@
+"""
+Benchmarks parsing and conversion on procedurally generated CHR archives,
+so no game data is needed.
+
+Usage, from the plugin directory:
+    python -m benchmarks [--preset medium] [--save baseline.json]
+    python -m benchmarks --compare baseline.json
+
+Each case reports its best time over '--repeat' runs, its throughput in
+MB/s and records/s, and the peak memory allocated during one run. Results
+can be saved as a baseline, and later runs compared against it; comparing
+exits with status 1 if any case regressed by more than '--threshold'.
+"""
+import argparse
+import sys
+
+from .Generators import texture_formats
+from .Suite import presets, run, save_baseline, load_baseline, compare
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description="Benchmarks the file parsers on generated CHR archives.")
+    parser.add_argument("--preset", choices=presets, default="medium",
+                        help="Size of the generated archive (default: medium)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--submodels", type=int, dest="submodel_count")
+    parser.add_argument("--bones", type=int, dest="bone_count")
+    parser.add_argument("--meshes", type=int, dest="mesh_count")
+    parser.add_argument("--vertices", type=int, dest="vertex_count", help="Vertices per mesh")
+    parser.add_argument("--strips", type=int, dest="strip_count", help="Strips per mesh")
+    parser.add_argument("--strip-length", type=int, dest="strip_length", help="Maximum vertices per strip")
+    parser.add_argument("--influences", type=int, help="Bones weighted to each vertex")
+    parser.add_argument("--animations", type=int, dest="animation_count")
+    parser.add_argument("--frames", type=int, dest="frame_count", help="Frames per animation")
+    parser.add_argument("--textures", type=int, dest="texture_count")
+    parser.add_argument("--texture-size", type=int, dest="texture_size")
+    parser.add_argument("--texture-format", choices=texture_formats, dest="texture_format")
+    parser.add_argument("--mipmaps", type=int, dest="mipmap_count")
+
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per case (default: 5)")
+    parser.add_argument("--filter", help="Only run cases whose name contains this")
+    parser.add_argument("--no-memory", action="store_true", help="Skip measuring peak memory")
+    parser.add_argument("--save", metavar="FILE", help="Save the results as a baseline")
+    parser.add_argument("--compare", metavar="FILE", help="Compare the results against a saved baseline")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Relative slowdown or memory growth counted as a regression (default: 0.1)")
+    args = parser.parse_args(argv)
+
+    parameters = dict(presets[args.preset], seed=args.seed)
+    for key in ("submodel_count", "bone_count", "mesh_count", "vertex_count", "strip_count", "strip_length",
+                "influences", "animation_count", "frame_count", "texture_count", "texture_size",
+                "texture_format", "mipmap_count"):
+        value = getattr(args, key)
+        if value is not None:
+            parameters[key] = value
+
+    baseline = load_baseline(args.compare) if args.compare else None
+    results = run(parameters, args.repeat, args.filter, not args.no_memory)
+    if args.save:
+        save_baseline(args.save, parameters, results)
+        print(f"Saved baseline to {args.save}")
+    if baseline is not None:
+        print()
+        regressions = compare(baseline, parameters, results, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} case(s) regressed: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
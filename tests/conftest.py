@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Import DarkCloudModelTools and benchmarks as top-level packages, as the
+# command-line tools do, rather than through the Blender add-on
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,98 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from benchmarks.Generators import generate_chr, to_bytes
+from DarkCloudModelTools.filetypes.CHR.CHRBinary import CHRBinary
+from DarkCloudModelTools.filetypes.MDS.MDSBinary import MDSBinary
+
+
+class GeneratedArchiveTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filepath = os.path.join(self.directory.name, "model.chr")
+        self.data = to_bytes(generate_chr(seed=1, bone_count=8, mesh_count=2, vertex_count=50,
+                                          strip_count=10, animation_count=4, frame_count=8,
+                                          texture_count=2, texture_size=16))
+        with open(self.filepath, 'wb') as F:
+            F.write(self.data)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def read_back(self, filepath=None):
+        with open(filepath or self.filepath, 'rb') as F:
+            return F.read()
+
+
+class TestRoundTrip(GeneratedArchiveTestCase):
+    modes = {
+        "default":  dict(),
+        "ndarrays": dict(use_ndarrays=True),
+        "lazy":     dict(lazy=True),
+    }
+
+    def round_trip(self, lazy=False, use_ndarrays=False, decode=False):
+        binary = CHRBinary(lazy=lazy)
+        binary.read(self.filepath, use_ndarrays)
+        if decode:
+            for file in binary.files:
+                file.file
+        out_path = os.path.join(self.directory.name, "out.chr")
+        binary.write(out_path)
+        return self.read_back(out_path)
+
+    def test_round_trip(self):
+        for name, kwargs in self.modes.items():
+            with self.subTest(mode=name):
+                self.assertEqual(self.round_trip(**kwargs), self.data)
+
+    def test_round_trip_decoded_lazy(self):
+        # Decoded subfiles are packed again rather than copied
+        self.assertEqual(self.round_trip(lazy=True, decode=True), self.data)
+        self.assertEqual(self.round_trip(lazy=True, use_ndarrays=True, decode=True), self.data)
+
+
+class TestLazyWriteBack(GeneratedArchiveTestCase):
+
+    def test_write_over_source(self):
+        # Undecoded payloads are views of the mapped file being replaced
+        binary = CHRBinary(lazy=True)
+        binary.read(self.filepath)
+        binary.files[0].file
+        binary.write(self.filepath)
+        self.assertEqual(self.read_back(), self.data)
+
+        # The archive must still be usable once its source was replaced
+        binary.write(self.filepath)
+        self.assertEqual(self.read_back(), self.data)
+
+    def test_failed_decode_keeps_payload(self):
+        binary = CHRBinary(lazy=True)
+        binary.read(self.filepath)
+        mds_file = binary.files[1]
+        with mock.patch.object(MDSBinary, "read_write", side_effect=ValueError("Malformed")):
+            with self.assertRaises(ValueError):
+                mds_file.file
+        self.assertFalse(mds_file.is_loaded())
+        out_path = os.path.join(self.directory.name, "out.chr")
+        binary.write(out_path)
+        self.assertEqual(self.read_back(out_path), self.data)
+
+        # The decode can be retried once whatever made it fail is fixed
+        self.assertIsInstance(mds_file.file, MDSBinary)
+        self.assertTrue(mds_file.is_loaded())
+
+    def test_failed_write_keeps_file(self):
+        binary = CHRBinary()
+        binary.read(self.filepath)
+        binary.files[1].file.contents.filetype = b"XXXX"
+        with self.assertRaises(AssertionError):
+            binary.write(self.filepath)
+        self.assertEqual(self.read_back(), self.data)
+        self.assertEqual(os.listdir(self.directory.name), ["model.chr"])
+
+
+if __name__ == "__main__":
+    unittest.main()
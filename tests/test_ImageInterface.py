@@ -0,0 +1,117 @@
+import struct
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+from DarkCloudModelTools.filetypes.IMG.ImageInterface import ImageInterface, csm1_permutation, decode_colours, unpack_indices
+
+
+def reference_csm1(palette):
+    """
+    The nested loop that csm1_permutation replaced, counted in colours
+    rather than in bytes of 32-bit colours.
+    """
+    parts   = len(palette) // 32
+    stripes = 2
+    colours = 8
+    blocks  = 2
+
+    new_idx = 0
+    new_palette = [None]*len(palette)
+    for part in range(parts):
+        for block in range(blocks):
+            for stripe in range(stripes):
+                for colour in range(colours):
+                    old_idx  = part * colours * stripes * blocks
+                    old_idx += block * colours
+                    old_idx += stripe * stripes * colours
+                    old_idx += colour
+                    new_palette[new_idx] = palette[old_idx]
+                    new_idx += 1
+    return new_palette
+
+
+class TestCSM1(unittest.TestCase):
+    def test_against_loop(self):
+        for count in (32, 64, 256):
+            with self.subTest(count=count):
+                palette = list(range(count))
+                self.assertEqual(csm1_permutation(count).tolist(), reference_csm1(palette))
+
+    def test_swaps_bits_3_and_4(self):
+        permutation = csm1_permutation(32).tolist()
+        self.assertEqual(permutation[:8], list(range(8)))
+        self.assertEqual(permutation[8:16], list(range(16, 24)))
+        self.assertEqual(permutation[16:24], list(range(8, 16)))
+        self.assertEqual(permutation[24:], list(range(24, 32)))
+
+    def test_small_palettes_unchanged(self):
+        self.assertEqual(csm1_permutation(16).tolist(), list(range(16)))
+
+
+class TestDecodeColours(unittest.TestCase):
+    def test_5551(self):
+        # Red in the low bits, then green and blue, and alpha in the top bit
+        values = [0x001F, 0x03E0, 0x7C00, 0x8000, 0x8421]
+        colours = decode_colours(struct.pack("<5H", *values), 2)
+        np.testing.assert_allclose(colours, [
+            [1, 0, 0, 0],
+            [0, 1, 0, 0],
+            [0, 0, 1, 0],
+            [0, 0, 0, 1],
+            [1/31, 1/31, 1/31, 1],
+        ], rtol=1e-6)
+
+    def test_5551_is_little_endian(self):
+        colours = decode_colours(b"\x1F\x00", 2)
+        np.testing.assert_allclose(colours, [[1, 0, 0, 0]])
+
+    def test_24_and_32_bit(self):
+        np.testing.assert_allclose(decode_colours(bytes([255, 0, 51]), 3), [[1, 0, 0.2, 1]], rtol=1e-6)
+        np.testing.assert_allclose(decode_colours(bytes([0, 255, 0, 51]), 4), [[0, 1, 0, 0.2]], rtol=1e-6)
+
+    def test_invalid_size(self):
+        with self.assertRaises(ValueError):
+            decode_colours(b"\x00", 1)
+
+
+class TestUnpackIndices(unittest.TestCase):
+    def test_4bpp_low_nibble_first(self):
+        self.assertEqual(unpack_indices(bytes([0x21, 0x43, 0xF0]), 4).tolist(), [1, 2, 3, 4, 0, 15])
+
+    def test_8bpp(self):
+        self.assertEqual(unpack_indices(bytes([0, 7, 255]), 8).tolist(), [0, 7, 255])
+
+    def test_invalid_bpp(self):
+        with self.assertRaises(ValueError):
+            unpack_indices(b"\x00", 2)
+
+
+class TestFromTM2(unittest.TestCase):
+    @staticmethod
+    def make_tm2(image_colour_type, clut_colour_type, clut, texture, width, height):
+        header = SimpleNamespace(image_colour_type=image_colour_type, clut_colour_type=clut_colour_type,
+                                 clut_colour_count=len(clut) // ((clut_colour_type & 0x07) + 1),
+                                 clut_size=len(clut), image_width=width, image_height=height)
+        return SimpleNamespace(header=header, clut=clut, texture=[texture])
+
+    def test_8bpp_csm1(self):
+        # 256 colours of 32 bits, whose red channel is the stored position
+        clut = bytes(value for idx in range(256) for value in (idx, 0, 0, 255))
+        tm2 = self.make_tm2(5, 0x03, clut, bytes([0, 8, 16, 24]), 2, 2)
+        ii = ImageInterface.from_TM2(tm2)
+        red = np.round(ii.pixels.reshape(-1, 4)[:, 0] * 255).astype(int).tolist()
+        self.assertEqual(red, [0, 16, 8, 24])
+
+    def test_4bpp_5551(self):
+        clut = struct.pack("<16H", *[0x8000 | idx for idx in range(16)])
+        tm2 = self.make_tm2(4, 0x01, clut, bytes([0x21, 0x0F]), 2, 2)
+        ii = ImageInterface.from_TM2(tm2)
+        red = np.round(ii.pixels.reshape(-1, 4)[:, 0] * 31).astype(int).tolist()
+        self.assertEqual(red, [1, 2, 15, 0])
+        self.assertEqual(ii.pixels.reshape(-1, 4)[:, 3].tolist(), [1, 1, 1, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
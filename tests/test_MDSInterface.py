@@ -0,0 +1,105 @@
+import unittest
+
+import numpy as np
+
+from DarkCloudModelTools.filetypes.MDS.MDSBinary import Strip
+from DarkCloudModelTools.filetypes.MDS.MDSInterface import expand_strips
+
+
+def make_strip(type, positions, material_idx=0, wide=False):
+    """
+    Builds a Strip whose normal and UV indices are offset from its position
+    indices, so every column of the output can be told apart.
+    """
+    strip = Strip()
+    strip.type = type
+    strip.is_wide_vertex = int(wide)
+    strip.vertex_count = len(positions)
+    strip.material_idx = material_idx
+    strip.indices = [[p, p + 100, p + 200] + ([0] if wide else []) for p in positions]
+    return strip
+
+
+def reference_triangles(strips):
+    """
+    The per-triangle loop that expand_strips replaced, followed by the
+    removal of triangles that reuse a position.
+    """
+    triangles = []
+    for strip in strips:
+        rows = [tuple(row[:3]) for row in strip.indices]
+        if strip.type == 3:
+            tris = list(zip(rows[::3], rows[1::3], rows[2::3]))
+        else:
+            tris = [(a, b, c) if idx % 2 == 0 else (b, a, c)
+                    for idx, (a, b, c) in enumerate(zip(rows, rows[1:], rows[2:]))]
+        for tri in tris:
+            if len({row[0] for row in tri}) == 3:
+                triangles.append((tri, strip.material_idx))
+    return triangles
+
+
+class TestExpandStrips(unittest.TestCase):
+    def expand(self, strips):
+        indices, corners, face_strips, face_materials = expand_strips(strips)
+        triangles = [tuple(tuple(row) for row in indices[corner].tolist()) for corner in corners]
+        return triangles, face_strips.tolist(), face_materials.tolist()
+
+    def positions(self, strips):
+        return [[row[0] for row in tri] for tri in self.expand(strips)[0]]
+
+    def test_strip_winding(self):
+        self.assertEqual(self.positions([make_strip(4, [0, 1, 2, 3, 4])]),
+                         [[0, 1, 2], [2, 1, 3], [2, 3, 4]])
+
+    def test_list(self):
+        # Trailing rows that do not make up a whole triangle are ignored
+        self.assertEqual(self.positions([make_strip(3, [0, 1, 2, 3, 4, 5, 6])]),
+                         [[0, 1, 2], [3, 4, 5]])
+
+    def test_degenerate_triangles(self):
+        # Restarts repeat a position; the winding parity still counts them
+        self.assertEqual(self.positions([make_strip(4, [0, 1, 2, 2, 3, 4])]),
+                         [[0, 1, 2], [3, 2, 4]])
+        self.assertEqual(self.positions([make_strip(3, [0, 0, 1, 2, 3, 4])]), [[2, 3, 4]])
+
+    def test_short_strips(self):
+        for count in range(3):
+            for type in (3, 4):
+                with self.subTest(type=type, vertex_count=count):
+                    triangles, face_strips, face_materials = self.expand([make_strip(type, list(range(count)))])
+                    self.assertEqual((triangles, face_strips, face_materials), ([], [], []))
+
+    def test_short_strips_between_others(self):
+        strips = [make_strip(4, [0, 1, 2], 5), make_strip(4, []), make_strip(4, [3, 4]),
+                  make_strip(3, [5]), make_strip(4, [6, 7, 8, 9], 6)]
+        triangles, face_strips, face_materials = self.expand(strips)
+        self.assertEqual([[row[0] for row in tri] for tri in triangles], [[0, 1, 2], [6, 7, 8], [8, 7, 9]])
+        self.assertEqual(face_strips, [0, 4, 4])
+        self.assertEqual(face_materials, [5, 6, 6])
+
+    def test_mixed_types(self):
+        strips = [make_strip(4, [0, 1, 2, 3], 1), make_strip(3, [4, 5, 6, 7, 8, 9], 2, wide=True),
+                  make_strip(4, [10, 11, 12, 13, 14], 3), make_strip(3, [15, 16, 17], 4)]
+        triangles, face_strips, face_materials = self.expand(strips)
+        self.assertEqual(list(zip(triangles, face_materials)), reference_triangles(strips))
+        self.assertEqual(face_strips, [0, 0, 1, 1, 2, 2, 2, 3])
+
+    def test_random_against_reference(self):
+        rng = np.random.default_rng(0)
+        strips = []
+        for _ in range(50):
+            count = int(rng.integers(0, 12))
+            # Few distinct positions, so degenerate triangles are common
+            positions = rng.integers(0, 6, count).tolist()
+            strips.append(make_strip(int(rng.choice([3, 4])), positions, int(rng.integers(0, 4)), bool(rng.integers(0, 2))))
+        triangles, _, face_materials = self.expand(strips)
+        self.assertEqual(list(zip(triangles, face_materials)), reference_triangles(strips))
+
+    def test_unknown_type(self):
+        with self.assertRaises(NotImplementedError):
+            expand_strips([make_strip(5, [0, 1, 2])])
+
+
+if __name__ == "__main__":
+    unittest.main()
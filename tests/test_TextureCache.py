@@ -0,0 +1,46 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from DarkCloudModelTools.filetypes.IMG.TextureCache import TextureCache
+
+
+class TestCorruptEntries(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = TextureCache(self.directory.name)
+        self.key = "0" * 40
+        self.cache.put(self.key, size=np.array([4, 4]), mipmap_0=np.zeros((4, 4, 4), np.float32))
+        with open(self.cache.path(self.key), 'rb') as F:
+            self.data = F.read()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def corrupt(self, data):
+        with open(self.cache.path(self.key), 'wb') as F:
+            F.write(data)
+
+    def test_miss(self):
+        self.assertIsNone(self.cache.get("1" * 40))
+
+    def test_hit(self):
+        self.assertEqual(sorted(self.cache.get(self.key)), ["mipmap_0", "size"])
+
+    def test_overwrite_keeps_size(self):
+        for _ in range(3):
+            self.cache.put(self.key, size=np.array([4, 4]), mipmap_0=np.zeros((4, 4, 4), np.float32))
+        self.assertEqual(self.cache.size, len(self.data))
+
+    def test_corrupt_entries_are_deleted(self):
+        for data in (b"", self.data[:len(self.data) // 2], b"PK\x03\x04" + b"\x00" * 64):
+            with self.subTest(size=len(data)):
+                self.corrupt(data)
+                self.assertIsNone(self.cache.get(self.key))
+                self.assertFalse(os.path.exists(self.cache.path(self.key)))
+
+
+if __name__ == "__main__":
+    unittest.main()